@@ -141,6 +141,13 @@ function connectWebSocket() {
   
   ws.onclose = (event) => {
     log(`🔌 WebSocket disconnected: ${event.code} - ${event.reason}`);
+    
+    // Request RPC đang chờ sẽ không có response nữa
+    for (const [id, pending] of rpcPending) {
+      clearTimeout(pending.timer);
+      pending.reject(new Error("WebSocket closed"));
+    }
+    rpcPending.clear();
     updateStatus("Disconnected - Reconnecting...", "warning");
     
     // Reconnect after 3 seconds
@@ -158,11 +165,53 @@ function connectWebSocket() {
   };
 }
 
+// ===== WEBSOCKET RPC =====
+// Pipelined request/response qua WebSocket: mỗi request có id, response khớp theo id
+let rpcNextId = 1;
+const rpcPending = new Map();
+const RPC_TIMEOUT_MS = 30000;
+
+function rpcCall(method, params) {
+  return new Promise((resolve, reject) => {
+    if (!ws || ws.readyState !== WebSocket.OPEN) {
+      reject(new Error("WebSocket not connected"));
+      return;
+    }
+    const id = rpcNextId++;
+    const timer = setTimeout(() => {
+      rpcPending.delete(id);
+      reject(new Error(`RPC ${method} timed out`));
+    }, RPC_TIMEOUT_MS);
+    rpcPending.set(id, { resolve, reject, timer });
+    ws.send(JSON.stringify({ type: "rpc", id, method, params }));
+  });
+}
+
+function settleRpc(payload, ok) {
+  const pending = rpcPending.get(payload.id);
+  if (!pending) return;
+  rpcPending.delete(payload.id);
+  clearTimeout(pending.timer);
+  if (ok) {
+    pending.resolve(payload.result);
+  } else {
+    pending.reject(new Error(payload.error ? payload.error.message : "RPC error"));
+  }
+}
+
 // PRESERVING YOUR WebSocket message handling
 function handleWebSocketMessage(data) {
   const messageType = data.type || 'unknown';
   
   switch (messageType) {
+    case 'rpc_result':
+      settleRpc(data.data, true);
+      break;
+      
+    case 'rpc_error':
+      settleRpc(data.data, false);
+      break;
+      
     case 'telegram_message':
       if (data.data && data.data.chat_id && data.data.sender && data.data.text) {
         addMessage(data.data.chat_id, data.data.sender, data.data.text);
@@ -193,6 +242,13 @@ async function sendReply(chat_id, text) {
   try {
     updateStatus("Sending reply...", "info");
     
+    // Ưu tiên gửi qua WebSocket đang mở, fallback về REST
+    if (ws && ws.readyState === WebSocket.OPEN) {
+      await rpcCall("send", { chat_id: parseInt(chat_id), text: text });
+      onReplySent(chat_id, text);
+      return;
+    }
+    
     const response = await fetch(`${SERVER}/api/send`, {
       method: 'POST',
       headers: {
@@ -205,16 +261,7 @@ async function sendReply(chat_id, text) {
     });
     
     if (response.ok) {
-      const result = await response.json();
-      speakFeedback("Đã gửi trả lời.");
-      updateStatus("✅ Reply sent successfully", "success");
-      log(`✅ Reply sent to chat ${chat_id}: ${text.substring(0, 50)}...`);
-      
-      // Reset status after 3 seconds
-      setTimeout(() => {
-        updateStatus("Ready - Say 'Hey Viso'", "success");
-      }, 3000);
-      
+      onReplySent(chat_id, text);
     } else {
       const error = await response.json();
       throw new Error(error.detail || 'Unknown error');
@@ -227,6 +274,17 @@ async function sendReply(chat_id, text) {
   }
 }
 
+function onReplySent(chat_id, text) {
+  speakFeedback("Đã gửi trả lời.");
+  updateStatus("✅ Reply sent successfully", "success");
+  log(`✅ Reply sent to chat ${chat_id}: ${text.substring(0, 50)}...`);
+  
+  // Reset status after 3 seconds
+  setTimeout(() => {
+    updateStatus("Ready - Say 'Hey Viso'", "success");
+  }, 3000);
+}
+
 // ===== VOICE COMMAND PROCESSING =====
 // PRESERVING YOUR EXACT handleTranscript function with enhancements
 function handleTranscript(raw){
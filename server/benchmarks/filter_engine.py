@@ -0,0 +1,100 @@
+# server/benchmarks/filter_engine.py
+"""Đo chi phí MessageFilter.match cho mỗi update group/channel
+
+Sinh tin nhắn group tiếng Việt giả (có dấu, emoji, @mention, reply) cho
+`--chats` chat, mỗi chat một rule với `--keywords` từ khoá, rồi chạy
+match() như trong event builder của Telethon. So với cách ngây thơ cùng
+ngữ nghĩa: bỏ dấu rồi thử regex từng từ khoá một.
+
+Chạy: cd server && python benchmarks/filter_engine.py [số tin] [--chats N] [--keywords N]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+for key, value in {
+    "TELEGRAM_API_ID": "1", "TELEGRAM_API_HASH": "bench", "TELEGRAM_PHONE": "+10000000000",
+    "TELEGRAM_SESSION_STRING": "", "SECRET_KEY": "bench", "DATABASE_URL": "",
+    "MONITOR_RULES_PATH": "/nonexistent/monitor_rules.json",
+}.items():
+    os.environ.setdefault(key, value)
+
+from telegram.filters import message_filter  # noqa: E402
+from telegram.schemas import ChatRule, MonitorRules  # noqa: E402
+from telegram.search import fold_text  # noqa: E402
+from telegram.trace import ReplayEvent, ReplayMessage  # noqa: E402
+
+WORDS = (
+    "hôm nay trời đẹp quá mọi người ơi họp lúc mấy giờ vậy anh chị em nhớ gửi báo cáo "
+    "tuần này nhé deadline thứ sáu khách hàng phản hồi rồi giá vàng tăng mạnh lãi suất "
+    "ngân hàng điều chỉnh đơn hàng mới cần xử lý gấp ok 👍 cảm ơn bạn nha"
+).split()
+KEYWORDS = (
+    "đơn hàng", "khách hàng", "lãi suất", "giá vàng", "khẩn cấp", "hợp đồng", "thanh toán",
+    "báo giá", "Nguyễn Văn A", "server down", "bảo trì", "hoàn tiền", "khiếu nại", "tuyển dụng",
+)
+
+def build_events(count: int, chats: int):
+    rng = random.Random(42)
+    events = []
+    for i in range(count):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 40)))
+        message = ReplayMessage(
+            id=i, message=text, sender_id=rng.randint(1, 5000),
+            mentioned=rng.random() < 0.01, reply_to=None
+        )
+        events.append(ReplayEvent(chat_id=-1000000000000 - rng.randint(1, chats), message=message))
+    return events
+
+def naive_match(rules: dict, event):
+    rule = rules.get(event.chat_id)
+    if rule is None:
+        return None
+    senders, patterns = rule
+    if event.message.sender_id in senders:
+        return "sender"
+    if event.message.mentioned:
+        return "mention"
+    folded = fold_text(event.message.message)
+    for pattern in patterns:
+        if pattern.search(folded):
+            return "keyword"
+    return None
+
+def measure(name: str, match, events):
+    started = time.perf_counter()
+    matched = sum(1 for event in events if match(event) is not None)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<16} {elapsed / len(events) * 1e6:6.2f}µs/event "
+          f"({len(events) / elapsed:,.0f} events/s, {matched} matched)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("messages", type=int, nargs="?", default=100000)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--keywords", type=int, default=len(KEYWORDS))
+    args = parser.parse_args()
+
+    keywords = list(KEYWORDS[:args.keywords]) + [f"mã {i}" for i in range(args.keywords - len(KEYWORDS))]
+    rules = MonitorRules(rules={
+        str(-1000000000000 - c): ChatRule(keywords=keywords, senders=[c, c + 1]) for c in range(1, args.chats + 1)
+    })
+    message_filter.compile(rules)
+    naive_rules = {
+        int(key): (set(rule.senders), [re.compile(r"(?<!\w)" + re.escape(fold_text(k)) + r"(?!\w)") for k in keywords])
+        for key, rule in rules.rules.items()
+    }
+    events = build_events(args.messages, args.chats)
+
+    print(f"{args.messages} messages, {args.chats} chats, {len(keywords)} keywords per rule\n")
+    measure("naive (per kw)", lambda event: naive_match(naive_rules, event), events)
+    measure("MessageFilter", message_filter.match, events)
+    print(f"\nStats: {message_filter.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# server/benchmarks/replay_trace.py
+"""Replay trace update thật (TRACE_PATH) qua handlers -> pipeline -> WebSocketManager
+
+Không có mạng: event dựng từ trace được đưa vào đúng các handler mà
+register_handlers đăng ký (áp dụng filter incoming/func như Telethon),
+broadcast tới các WebSocket giả trong bộ nhớ. Đo throughput và latency
+từ lúc event vào tới lúc frame tới client.
+
+Chạy: cd server && python benchmarks/replay_trace.py trace.jsonl.gz [--speed 1|10|max] [--clients N]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+for key, value in {
+    "TELEGRAM_API_ID": "1", "TELEGRAM_API_HASH": "bench", "TELEGRAM_PHONE": "+10000000000",
+    "TELEGRAM_SESSION_STRING": "", "SECRET_KEY": "bench", "DATABASE_URL": "",
+    "SEARCH_ENABLED": "false", "TRANSCRIPTION_ENABLED": "false", "TRACE_PATH": "",
+}.items():
+    os.environ.setdefault(key, value)
+
+import msgpack  # noqa: E402
+from telethon import events  # noqa: E402
+from api.protocol import json_codec, msgpack_codec  # noqa: E402
+from api.websocket import websocket_manager  # noqa: E402
+from core.monitor import loop_monitor, percentile  # noqa: E402
+from telegram.handlers import register_handlers  # noqa: E402
+from telegram.pipeline import handler_pipeline  # noqa: E402
+from telegram.routing import edit_debouncer  # noqa: E402
+from telegram.trace import build_event, read_trace  # noqa: E402
+
+# Loại frame broadcast -> loại event trong trace
+FRAME_KINDS = {"message": "n", "message_edited": "e", "message_deleted": "d"}
+
+class ReplayClient:
+    """Thay TelegramClient: chỉ giữ các handler đã đăng ký để replay gọi"""
+
+    def __init__(self):
+        self.handlers = []
+
+    def on(self, builder):
+        # Telethon nhận cả class builder (events.MessageDeleted) lẫn instance
+        if isinstance(builder, type):
+            builder = builder()
+
+        def decorator(callback):
+            self.handlers.append((builder, callback))
+            return callback
+        return decorator
+
+    async def dispatch(self, event):
+        for builder, callback in self.handlers:
+            if self._matches(builder, event):
+                await callback(event)
+
+    @staticmethod
+    def _matches(builder, event) -> bool:
+        if event.kind == "d":
+            return type(builder) is events.MessageDeleted
+        expected = events.MessageEdited if event.kind == "e" else events.NewMessage
+        if type(builder) is not expected:
+            return False
+        if builder.incoming and event.message.out:
+            return False
+        if builder.outgoing and not event.message.out:
+            return False
+        return builder.func is None or bool(builder.func(event))
+
+class ProbeWebSocket:
+    """WebSocket giả; client đầu tiên decode frame để đo latency"""
+
+    def __init__(self, probe: bool, latencies: dict, injected: dict):
+        self.probe = probe
+        self.latencies = latencies
+        self.injected = injected
+        self.frames = 0
+        self.bytes = 0
+
+    async def send_text(self, data: str):
+        self._received(data, json.loads)
+
+    async def send_bytes(self, data: bytes):
+        self._received(data, msgpack.unpackb)
+
+    def _received(self, data, decode):
+        self.frames += 1
+        self.bytes += len(data)
+        if not self.probe:
+            return
+        now = time.perf_counter()
+        envelope = decode(data)
+        kind = FRAME_KINDS.get(envelope.get("type") or envelope.get("t"))
+        if kind is None:
+            return
+        payload = envelope.get("data") or envelope.get("d") or {}
+        ids = payload.get("message_ids") or [payload.get("message_id")]
+        for message_id in ids:
+            started = self.injected.pop((kind, message_id), None)
+            if started is not None:
+                self.latencies[kind].append((now - started) * 1000)
+
+async def drain():
+    """Chờ debouncer + queue pipeline xử lý hết"""
+    await edit_debouncer.flush()
+    while handler_pipeline.depth:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.05)
+
+async def replay(args):
+    entries = list(read_trace(args.trace))
+    if not entries:
+        sys.exit("Trace is empty")
+    client = ReplayClient()
+    loop_monitor.start()
+    await register_handlers(client)
+
+    latencies = defaultdict(list)
+    injected = {}
+    codec = msgpack_codec if args.codec == "msgpack" else json_codec
+    sockets = [ProbeWebSocket(i == 0, latencies, injected) for i in range(args.clients)]
+    for ws in sockets:
+        websocket_manager.active_connections.add(ws)
+        websocket_manager.codecs[ws] = codec
+
+    speed = None if args.speed == "max" else float(args.speed)
+    kinds = Counter(entry["k"] for entry in entries)
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    base = loop.time()
+    for entry in entries:
+        if speed:
+            delay = base + entry["t"] / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        event = build_event(entry)
+        for message_id in (event.deleted_ids if entry["k"] == "d" else [event.message.id]):
+            injected[(entry["k"], message_id)] = time.perf_counter()
+        await client.dispatch(event)
+    injected_at = time.perf_counter() - started
+    await drain()
+    elapsed = time.perf_counter() - started
+
+    trace_span = entries[-1]["t"] - entries[0]["t"]
+    delivered = sum(len(values) for values in latencies.values())
+    print(f"Trace: {len(entries)} events over {trace_span:.1f}s "
+          f"({', '.join(f'{k}={v}' for k, v in sorted(kinds.items()))})")
+    print(f"Replay at {'max speed' if speed is None else f'{speed:g}x'}, {args.clients} {codec.name} clients: "
+          f"injected in {injected_at:.2f}s, drained in {elapsed:.2f}s")
+    print(f"Throughput: {len(entries) / elapsed:,.0f} events/s in, "
+          f"{delivered / elapsed:,.0f} broadcasts/s out "
+          f"({sockets[0].frames} frames, {sockets[0].bytes / 1024:.0f} KiB per client)")
+    for kind, name in (("n", "new"), ("e", "edit"), ("d", "delete")):
+        values = sorted(latencies.get(kind, []))
+        if values:
+            print(f"  {name:<7} n={len(values):<7} p50 {percentile(values, 0.5):7.2f}ms "
+                  f"p90 {percentile(values, 0.9):7.2f}ms p99 {percentile(values, 0.99):7.2f}ms "
+                  f"max {values[-1]:7.2f}ms")
+    lag = loop_monitor.percentiles()
+    print(f"Pipeline: {handler_pipeline.stats()}")
+    print(f"Loop lag: p50 {lag['p50_ms']}ms p99 {lag['p99_ms']}ms max {lag['max_ms']}ms; "
+          f"edits collapsed by debouncer: {edit_debouncer.collapsed}")
+
+    await handler_pipeline.stop()
+    await loop_monitor.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("trace", help="File trace ghi bởi TRACE_PATH (.jsonl hoặc .jsonl.gz)")
+    parser.add_argument("--speed", default="1", help="Hệ số tốc độ (1, 10, ...) hoặc 'max'")
+    parser.add_argument("--clients", type=int, default=5, help="Số WebSocket giả nhận broadcast")
+    parser.add_argument("--codec", choices=("json", "msgpack"), default="json")
+    args = parser.parse_args()
+    if args.speed != "max" and float(args.speed) <= 0:
+        parser.error("--speed must be > 0 or 'max'")
+    asyncio.run(replay(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# server/benchmarks/session_persistence.py
+"""Đo thời gian event loop bị chặn bởi session: SQLiteSession vs BufferedFileSession
+
+Giả lập luồng update tốc độ cao như Telethon xử lý: mỗi update gọi
+process_entities (users/chats đi kèm), set_update_state, get_input_entity;
+cứ `--save-every` update thì chạy như keepalive của Telethon
+(_save_states_and_entities + session.save()). Mọi lời gọi đều chạy trên
+thread hiện tại, nên thời gian đo được chính là thời gian loop bị chặn.
+
+Chạy: cd server && python benchmarks/session_persistence.py [số update] [--save-every N] [--dir DIR]
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+for key, value in {
+    "TELEGRAM_API_ID": "1", "TELEGRAM_API_HASH": "bench", "TELEGRAM_PHONE": "+10000000000",
+    "TELEGRAM_SESSION_STRING": "", "SECRET_KEY": "bench", "DATABASE_URL": "",
+}.items():
+    os.environ.setdefault(key, value)
+
+from telethon.sessions import SQLiteSession  # noqa: E402
+from telethon.tl import types  # noqa: E402
+from telegram.session import BufferedFileSession  # noqa: E402
+
+def build_users(count: int):
+    rng = random.Random(42)
+    return [
+        types.User(
+            id=1_000_000 + i,
+            access_hash=rng.getrandbits(63),
+            first_name=rng.choice(["An", "Bình", "Alice", "Bob"]),
+            last_name=f"#{i}",
+            username=f"user{i}" if i % 3 == 0 else None,
+            phone=None
+        )
+        for i in range(count)
+    ]
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+def run(session, users, updates: int, save_every: int):
+    """Trả về (thời gian chặn mỗi update, mỗi lần save, khi close) tính bằng ms"""
+    rng = random.Random(7)
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    per_update, per_save = [], []
+    pts = 1
+    # Như TelegramClient._save_states_and_entities trong keepalive (tạo sẵn, không tính giờ)
+    keepalive_entities = types.contacts.ResolvedPeer(
+        None, [types.InputPeerUser(u.id, u.access_hash) for u in users], []
+    )
+    for i in range(updates):
+        sender = rng.choice(users)
+        batch = types.Updates(updates=[], users=[sender, rng.choice(users)], chats=[], date=now, seq=0)
+
+        started = time.perf_counter()
+        session.process_entities(batch)
+        pts += 1
+        session.set_update_state(0, types.updates.State(pts, 0, now, 0, unread_count=0))
+        session.get_input_entity(sender.id)
+        per_update.append((time.perf_counter() - started) * 1000)
+
+        if (i + 1) % save_every == 0:
+            started = time.perf_counter()
+            session.process_entities(keepalive_entities)
+            session.save()
+            per_save.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    session.close()
+    close_ms = (time.perf_counter() - started) * 1000
+    return per_update, per_save, close_ms
+
+def report(name: str, per_update, per_save, close_ms):
+    total = sum(per_update) + sum(per_save)
+    print(
+        f"{name:<22} update p50 {percentile(per_update, 0.5) * 1000:7.1f}µs "
+        f"p99 {percentile(per_update, 0.99) * 1000:7.1f}µs max {max(per_update):6.2f}ms | "
+        f"save avg {sum(per_save) / max(len(per_save), 1):6.2f}ms max {max(per_save, default=0):6.2f}ms | "
+        f"loop blocked {total:7.1f}ms total | close {close_ms:6.2f}ms"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("updates", type=int, nargs="?", default=20000)
+    parser.add_argument("--users", type=int, default=5000, help="Số entity khác nhau")
+    parser.add_argument("--save-every", type=int, default=2000, help="Số update giữa hai lần keepalive save")
+    parser.add_argument("--dir", default=".", help="Thư mục ghi session (nên cùng ổ đĩa với TELEGRAM_SESSION_DIR)")
+    args = parser.parse_args()
+    users = build_users(args.users)
+
+    print(f"{args.updates} updates, {args.users} entities, save every {args.save_every} updates\n")
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        for name, factory in (
+            ("SQLiteSession", lambda: SQLiteSession(f"{tmp}/sqlite")),
+            ("BufferedFileSession", lambda: BufferedFileSession(f"{tmp}/buffered.json", flush_interval=1.0)),
+        ):
+            per_update, per_save, close_ms = run(factory(), users, args.updates, args.save_every)
+            report(name, per_update, per_save, close_ms)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# server/benchmarks/ws_protocol.py
+"""Đo bytes/event và CPU/event cho JSON (v1) và MessagePack (v2) trên /ws
+
+Chạy: cd server && python benchmarks/ws_protocol.py [số event]
+"""
+import os
+import random
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+for key, value in {
+    "TELEGRAM_API_ID": "1", "TELEGRAM_API_HASH": "bench", "TELEGRAM_PHONE": "+10000000000",
+    "TELEGRAM_SESSION_STRING": "", "SECRET_KEY": "bench", "DATABASE_URL": "",
+}.items():
+    os.environ.setdefault(key, value)
+
+from api.protocol import json_codec, msgpack_codec  # noqa: E402
+from core.config import settings  # noqa: E402
+from telegram.schemas import TelegramMessage, WebSocketMessage  # noqa: E402
+
+SAMPLE_TEXTS = [
+    "ok", "Anh ơi tối nay họp lúc mấy giờ vậy?", "đã nhận được hoá đơn, cảm ơn nhé",
+    "Let me check and get back to you in a few minutes", "👍",
+    "Mình gửi lại file báo cáo tháng này, anh xem giúp phần chi phí vận chuyển nhé.",
+]
+
+def build_events(count: int):
+    """Sinh các event giống handle_new_message"""
+    rng = random.Random(42)
+    start = datetime.now() - timedelta(hours=1)
+    events = []
+    for i in range(count):
+        message = TelegramMessage(
+            chat_id=rng.randint(10_000_000, 9_999_999_999),
+            sender=rng.choice(["Nguyễn Văn An", "Alice", "Trần Thị Bình", "Bob Smith"]),
+            text=rng.choice(SAMPLE_TEXTS),
+            message_id=100_000 + i,
+            date=start + timedelta(seconds=i)
+        )
+        data = message.dict()
+        events.append(WebSocketMessage(type=data.get("type", "telegram_message"), data=data))
+    return events
+
+def deflate_stream(frames):
+    """Nén như permessage-deflate có context takeover (một stream cho cả connection)"""
+    compressor = zlib.compressobj(
+        settings.ws_compression_level, zlib.DEFLATED,
+        -settings.ws_compression_window_bits, settings.ws_compression_mem_level
+    )
+    total = 0
+    for frame in frames:
+        data = frame.encode("utf-8") if isinstance(frame, str) else frame
+        chunk = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        total += len(chunk) - 4  # bỏ 00 00 ff ff như RFC 7692
+    return total
+
+def measure(codec, events):
+    started = time.process_time()
+    frames = [codec.encode(event) for event in events]
+    encode_cpu = time.process_time() - started
+
+    started = time.process_time()
+    for frame in frames:
+        codec.decode(frame)
+    decode_cpu = time.process_time() - started
+
+    raw_bytes = sum(len(f.encode("utf-8")) if isinstance(f, str) else len(f) for f in frames)
+    return {
+        "raw": raw_bytes / len(events),
+        "deflated": deflate_stream(frames) / len(events),
+        "encode_us": encode_cpu / len(events) * 1e6,
+        "decode_us": decode_cpu / len(events) * 1e6,
+    }
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    events = build_events(count)
+    print(f"{count} events, deflate level={settings.ws_compression_level} "
+          f"wbits={settings.ws_compression_window_bits} memLevel={settings.ws_compression_mem_level}")
+    print(f"{'mode':<10}{'raw B/ev':>10}{'deflate B/ev':>14}{'encode µs':>12}{'decode µs':>12}")
+    for codec in (json_codec, msgpack_codec):
+        r = measure(codec, events)
+        print(f"{codec.name:<10}{r['raw']:>10.1f}{r['deflated']:>14.1f}"
+              f"{r['encode_us']:>12.2f}{r['decode_us']:>12.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# server/src/api/admission.py
+import logging
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Iterable, Optional
+from fastapi import HTTPException, Request, WebSocket
+from fastapi.responses import JSONResponse
+from core.config import settings
+from core.monitor import loop_monitor
+
+logger = logging.getLogger(__name__)
+
+# WebSocket close code 1013: Try Again Later
+WS_CLOSE_OVERLOADED = 1013
+# WebSocket close code 1008: Policy Violation
+WS_CLOSE_POLICY = 1008
+# Frame bị rate limit: báo lỗi tối đa một lần mỗi chừng này giây
+WS_DROP_NOTICE_INTERVAL = 1.0
+# Cửa sổ đo lạm dụng: drop quá `rate * window` frame trong cửa sổ thì đóng connection
+WS_ABUSE_WINDOW = 10.0
+
+class Overloaded(Exception):
+    """Từ chối nhanh vì quá tải / vượt giới hạn"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+class TokenBucket:
+    """Rate limit đơn giản: `rate` token/giây, tối đa `burst` token"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class MessageLimiter(TokenBucket):
+    """TokenBucket cho frame đến của một WebSocket, kèm theo dõi frame bị drop
+
+    Báo lỗi cho frame bị drop tối đa một lần mỗi WS_DROP_NOTICE_INTERVAL
+    giây để limiter không khuếch đại flood; client vẫn gửi vượt gấp đôi rate
+    suốt WS_ABUSE_WINDOW giây thì bị coi là lạm dụng (`abusive`).
+    """
+
+    def __init__(self, rate: float, burst: int):
+        super().__init__(rate, burst)
+        self.dropped = 0
+        self._window_started = self.updated
+        self._noticed_at: Optional[float] = None
+
+    def record_drop(self) -> bool:
+        """Ghi nhận một frame bị drop; True nếu nên gửi lỗi cho client"""
+        now = time.monotonic()
+        if now - self._window_started >= WS_ABUSE_WINDOW:
+            self._window_started = now
+            self.dropped = 0
+        self.dropped += 1
+        if self._noticed_at is None or now - self._noticed_at >= WS_DROP_NOTICE_INTERVAL:
+            self._noticed_at = now
+            return True
+        return False
+
+    @property
+    def abusive(self) -> bool:
+        return self.dropped > self.rate * WS_ABUSE_WINDOW
+
+class AdmissionController:
+    """Admission control cho /ws và các endpoint gửi tin
+
+    Giới hạn tổng số / mỗi IP số WebSocket, số lượt gửi đang chạy, và từ
+    chối ngay (503 + Retry-After hoặc close 1013) khi queue handler quá sâu
+    hoặc event loop bị trễ, thay vì làm chậm tất cả mọi người.
+    """
+
+    def __init__(self):
+        self.connections = 0
+        self.connections_per_ip: Counter = Counter()
+        self.inflight_sends = 0
+        self.rejected: Counter = Counter()
+
+    def overload_reason(self) -> Optional[str]:
+        """Lý do quá tải hiện tại, None nếu hệ thống bình thường"""
+        from telegram.pipeline import handler_pipeline
+        if handler_pipeline.depth >= settings.overload_queue_depth:
+            return "handler queue depth"
+        if loop_monitor.lag_ms >= settings.overload_loop_lag_ms:
+            return "event loop lag"
+        return None
+
+    def client_ip(self, connection) -> str:
+        """IP của client; sau proxy tin cậy (Railway...) lấy từ X-Forwarded-For
+        
+        Dùng địa chỉ cuối cùng trong header: do proxy liền trước thêm vào,
+        client không giả được (các giá trị phía trước do client tự gửi).
+        """
+        if settings.admission_trust_forwarded:
+            forwarded = connection.headers.get("x-forwarded-for")
+            if forwarded:
+                return forwarded.split(",")[-1].strip()
+        return connection.client.host if connection.client else "unknown"
+
+    def admit_connection(self, websocket: WebSocket) -> str:
+        """Nhận một WebSocket mới, trả về IP để release; raise Overloaded nếu từ chối"""
+        ip = self.client_ip(websocket)
+        reason = self.overload_reason()
+        if reason is None and self.connections >= settings.admission_max_connections:
+            reason = "too many connections"
+        if reason is None and self.connections_per_ip[ip] >= settings.admission_max_connections_per_ip:
+            reason = "too many connections from this address"
+        if reason is not None:
+            self.rejected[reason] += 1
+            logger.warning(f"⛔ WebSocket from {ip} rejected: {reason}")
+            raise Overloaded(reason)
+        self.connections += 1
+        self.connections_per_ip[ip] += 1
+        return ip
+
+    def release_connection(self, ip: str):
+        self.connections -= 1
+        self.connections_per_ip[ip] -= 1
+        if self.connections_per_ip[ip] <= 0:
+            del self.connections_per_ip[ip]
+
+    def message_limiter(self) -> MessageLimiter:
+        """Rate limiter cho message đến trên một connection"""
+        return MessageLimiter(settings.ws_message_rate, settings.ws_message_burst)
+
+    @asynccontextmanager
+    async def send_slot(self):
+        """Giữ một slot gửi tin; raise Overloaded nếu hết slot hoặc quá tải"""
+        reason = self.overload_reason()
+        if reason is None and self.inflight_sends >= settings.admission_max_inflight_sends:
+            reason = "too many concurrent sends"
+        if reason is not None:
+            self.rejected[reason] += 1
+            raise Overloaded(reason)
+        self.inflight_sends += 1
+        try:
+            yield
+        finally:
+            self.inflight_sends -= 1
+
+    def stats(self) -> dict:
+        return {
+            "connections": self.connections,
+            "inflight_sends": self.inflight_sends,
+            "loop_lag_ms": round(loop_monitor.lag_ms, 2),
+            "overloaded": self.overload_reason(),
+            "rejected": dict(self.rejected)
+        }
+
+# Singleton instance
+admission = AdmissionController()
+
+class UploadAdmissionMiddleware:
+    """Admission cho endpoint upload, chạy trước khi đọc body
+    
+    Dependency của FastAPI chỉ chạy sau khi multipart đã được parse (spool
+    cả file ra đĩa), nên upload bị từ chối phải chặn ở tầng ASGI. Slot gửi
+    được giữ suốt request.
+    """
+
+    def __init__(self, app, paths: Iterable[str]):
+        self.app = app
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        try:
+            async with admission.send_slot():
+                await self.app(scope, receive, send)
+        except Overloaded as e:
+            response = JSONResponse(
+                {"detail": f"Server busy: {e.reason}"},
+                status_code=503,
+                headers={"Retry-After": str(settings.admission_retry_after)}
+            )
+            await response(scope, receive, send)
+
+async def send_admission(request: Request):
+    """Dependency cho endpoint gửi tin: 503 + Retry-After khi không nhận thêm"""
+    try:
+        async with admission.send_slot():
+            yield
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Server busy: {e.reason}",
+            headers={"Retry-After": str(settings.admission_retry_after)}
+        )
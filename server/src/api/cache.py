@@ -0,0 +1,164 @@
+# server/src/api/cache.py
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import Counter, OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from core.config import settings
+from core.invalidation import invalidation, chat_tag, TAG_CHATS, TAG_ME, TAG_MESSAGES  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+class CachedResponse:
+    __slots__ = ("data", "body", "etag", "tags", "expires")
+
+    def __init__(self, data, body: bytes, etag: str, tags: Tuple[str, ...], expires: float):
+        self.data = data
+        self.body = body
+        self.etag = etag
+        self.tags = tags
+        self.expires = expires
+
+class ResponseCache:
+    """Cache response JSON của các route GET, invalidate theo sự kiện Telegram
+
+    Mỗi entry gắn các tag (vd. "chats", "chat:123"); tầng telegram phát
+    invalidation.invalidate(tag) khi có tin mới / sửa / xoá / đã đọc. ETag mạnh là hash
+    của body, nên poll không đổi trả 304 mà không gọi Telegram. TTL chỉ là
+    lưới an toàn cho thay đổi không có sự kiện.
+
+    Mỗi tag có một generation: response đang tính mà tag bị invalidate giữa
+    chừng sẽ không được lưu, tránh ghi đè bằng dữ liệu cũ. Nhiều request
+    cùng key lúc cache trống chỉ gọi Telegram một lần.
+    """
+
+    def __init__(self, capacity: int, ttl: float):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, CachedResponse]" = OrderedDict()
+        self._keys_by_tag: Dict[str, Set[tuple]] = {}
+        self._generations: Counter = Counter()
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: tuple) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: tuple, tags: Tuple[str, ...], data, generations: tuple) -> CachedResponse:
+        body = json.dumps(
+            jsonable_encoder(data), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        entry = CachedResponse(data, body, etag, tags, time.monotonic() + self.ttl)
+        # Có invalidate trong lúc đang lấy dữ liệu: trả về nhưng không lưu
+        if generations != self._generations_of(tags):
+            return entry
+        self._remove(key)
+        self._entries[key] = entry
+        for tag in tags:
+            self._keys_by_tag.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.capacity:
+            self._remove(next(iter(self._entries)))
+        return entry
+
+    def invalidate(self, *tags: str):
+        for tag in tags:
+            self._generations[tag] += 1
+            for key in self._keys_by_tag.pop(tag, ()):
+                self._remove(key)
+            self.invalidations += 1
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry.tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def _generations_of(self, tags: Iterable[str]) -> tuple:
+        return tuple(self._generations[tag] for tag in tags)
+
+    async def fetch(self, key: tuple, tags: Tuple[str, ...], produce: Callable[[], Awaitable[object]]) -> CachedResponse:
+        """Entry trong cache, hoặc gọi `produce()` rồi lưu lại"""
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            generations = self._generations_of(tags)
+            entry = self.put(key, tags, await produce(), generations)
+            future.set_result(entry)
+            return entry
+        except BaseException as e:
+            future.set_exception(e)
+            # Không ai chờ thì không log "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def respond(
+        self,
+        request: Request,
+        key: tuple,
+        tags: Tuple[str, ...],
+        produce: Callable[[], Awaitable[object]]
+    ) -> Response:
+        """Response có ETag; 304 nếu If-None-Match khớp"""
+        entry = await self.fetch(key, tags, produce)
+        headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), entry.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(entry.body, media_type="application/json", headers=headers)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "invalidations": self.invalidations
+        }
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """So sánh If-None-Match (so sánh yếu theo RFC 9110, chấp nhận `*` và W/)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+# Singleton instance
+response_cache = ResponseCache(settings.response_cache_size, settings.response_cache_ttl)
+invalidation.subscribe(response_cache.invalidate)
@@ -0,0 +1,30 @@
+# server/src/api/compression.py
+import logging
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def build_deflate_factory() -> ServerPerMessageDeflateFactory:
+    """permessage-deflate đã tinh chỉnh: cửa sổ nhỏ + memLevel thấp để giảm RAM mỗi connection"""
+    return ServerPerMessageDeflateFactory(
+        server_max_window_bits=settings.ws_compression_window_bits,
+        compress_settings={
+            "level": settings.ws_compression_level,
+            "memLevel": settings.ws_compression_mem_level
+        }
+    )
+
+class TunedWebSocketProtocol(WebSocketProtocol):
+    """WebSocket protocol của uvicorn với permessage-deflate theo settings
+
+    Uvicorn mặc định dùng factory không tham số (window 15 bits, memLevel 8,
+    ~256KB zlib state mỗi connection). Truyền class này qua `uvicorn.run(ws=...)`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.available_extensions = (
+            [build_deflate_factory()] if settings.ws_compression_enabled else []
+        )
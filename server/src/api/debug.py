@@ -0,0 +1,143 @@
+# server/src/api/debug.py
+import asyncio
+import cProfile
+import hmac
+import io
+import logging
+import marshal
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse, Response
+from core.config import settings
+from core.monitor import loop_monitor
+
+logger = logging.getLogger(__name__)
+debug_router = APIRouter()
+
+# Chỉ một phiên profile tại một thời điểm (cProfile không lồng được)
+_profile_lock = asyncio.Lock()
+
+async def require_debug_token(authorization: str = Header(None)):
+    """Dependency bảo vệ /debug: `Authorization: Bearer <DEBUG_TOKEN>`"""
+    if not settings.debug_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = (authorization or "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(token.encode(), settings.debug_token.encode()):
+        raise HTTPException(status_code=401, detail="Invalid debug token")
+
+def _sample_stacks(thread_id: int, seconds: float, interval: float) -> Counter:
+    """Sampling profiler: chụp stack của thread chạy event loop mỗi `interval` giây"""
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+            frame = frame.f_back
+        if names:
+            stacks[";".join(reversed(names))] += 1
+        time.sleep(interval)
+    return stacks
+
+@debug_router.get("/profile", dependencies=[Depends(require_debug_token)])
+async def profile(
+    seconds: float = Query(10.0, gt=0, le=60, description="Thời gian profile (giây)"),
+    format: str = Query("pstats", pattern="^(pstats|collapsed)$", description="pstats | collapsed"),
+    interval_ms: float = Query(5.0, ge=1, le=100, description="Chu kỳ lấy mẫu (collapsed)")
+):
+    """CPU profile của process đang chạy trong `seconds` giây
+
+    - pstats: cProfile, tải về và mở bằng `python -m pstats` / snakeviz
+    - collapsed: sampling stack của thread event loop, dùng cho flamegraph.pl / speedscope
+    """
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+    async with _profile_lock:
+        logger.info(f"🔬 Capturing {format} profile for {seconds}s")
+        if format == "collapsed":
+            stacks = await asyncio.to_thread(
+                _sample_stacks, threading.get_ident(), seconds, interval_ms / 1000
+            )
+            body = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+            return PlainTextResponse(body, headers={
+                "Content-Disposition": 'attachment; filename="profile.collapsed"'
+            })
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            raise HTTPException(status_code=409, detail="Another profiler is active")
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+
+        profiler.create_stats()
+        return Response(
+            marshal.dumps(profiler.stats),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": 'attachment; filename="profile.pstats"'}
+        )
+
+@debug_router.get("/profile/summary", dependencies=[Depends(require_debug_token)])
+async def profile_summary(
+    seconds: float = Query(5.0, gt=0, le=60),
+    limit: int = Query(40, ge=1, le=500),
+    sort: str = Query("cumulative", pattern="^(cumulative|tottime|ncalls)$")
+):
+    """cProfile dạng text (top hàm theo `sort`), xem nhanh không cần tải file"""
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    async with _profile_lock:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            raise HTTPException(status_code=409, detail="Another profiler is active")
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+        output = io.StringIO()
+        try:
+            stats = pstats.Stats(profiler, stream=output)
+        except (TypeError, ValueError):
+            # Profile rỗng (profiler khác chiếm hook giữa chừng)
+            raise HTTPException(status_code=409, detail="Profile collected no stats (another profiler active?)")
+        stats.sort_stats(sort).print_stats(limit)
+        return PlainTextResponse(output.getvalue())
+
+@debug_router.get("/tasks", dependencies=[Depends(require_debug_token)])
+async def dump_tasks(stack_limit: int = Query(20, ge=1, le=200)):
+    """Tất cả asyncio task cùng stack hiện tại"""
+    tasks = []
+    for task in asyncio.all_tasks():
+        stack = io.StringIO()
+        task.print_stack(limit=stack_limit, file=stack)
+        tasks.append({
+            "name": task.get_name(),
+            "coro": getattr(task.get_coro(), "__qualname__", repr(task.get_coro())),
+            "done": task.done(),
+            "cancelled": task.cancelled(),
+            "stack": stack.getvalue().splitlines()
+        })
+    tasks.sort(key=lambda t: t["name"])
+    return {"total": len(tasks), "tasks": tasks}
+
+@debug_router.get("/loop", dependencies=[Depends(require_debug_token)])
+async def loop_stats():
+    """Percentile độ trễ event loop và các lần loop bị chặn quá ngưỡng"""
+    return {
+        "current_lag_ms": round(loop_monitor.lag_ms, 2),
+        "lag": loop_monitor.percentiles(),
+        "slow_threshold_ms": settings.slow_callback_ms,
+        "slow_callbacks": list(loop_monitor.slow_callbacks)
+    }
@@ -0,0 +1,93 @@
+# server/src/api/protocol.py
+import json
+import logging
+from datetime import date, datetime
+from typing import Any, Optional, Union
+from fastapi import WebSocket
+from telegram.schemas import WebSocketMessage
+from core.config import settings
+
+try:
+    import msgpack
+except ImportError:  # msgpack là tuỳ chọn, thiếu thì chỉ còn JSON
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# Subprotocol client gửi trong Sec-WebSocket-Protocol để chọn frame nhị phân
+MSGPACK_SUBPROTOCOL = "tv.msgpack.v2"
+
+Frame = Union[str, bytes]
+
+def to_millis(value: Union[datetime, date]) -> int:
+    """Chuyển datetime sang epoch milliseconds (int)"""
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    return int(value.timestamp() * 1000)
+
+class JsonCodec:
+    """Protocol v1: frame JSON dạng text (mặc định, tương thích client cũ)"""
+
+    name = "json"
+    subprotocol: Optional[str] = None
+    binary = False
+    invalid_message = "Invalid JSON format"
+
+    def encode(self, message: WebSocketMessage) -> str:
+        return message.json()
+
+    def decode(self, raw: Frame) -> dict:
+        data = json.loads(raw)
+        if not isinstance(data, dict):
+            raise ValueError("Frame must be an object")
+        return data
+
+class MsgpackCodec:
+    """Protocol v2: frame MessagePack nhị phân, envelope rút gọn, timestamp là int (ms)"""
+
+    name = "msgpack"
+    subprotocol = MSGPACK_SUBPROTOCOL
+    binary = True
+    invalid_message = "Invalid MessagePack frame"
+
+    def encode(self, message: WebSocketMessage) -> bytes:
+        return msgpack.packb(
+            {"t": message.type, "d": message.data, "ts": to_millis(message.timestamp)},
+            default=self._default,
+            use_bin_type=True
+        )
+
+    def decode(self, raw: Frame) -> dict:
+        # Cho phép client v2 vẫn gửi text JSON (debug từ devtools)
+        if isinstance(raw, str):
+            return json_codec.decode(raw)
+        try:
+            data = msgpack.unpackb(raw, raw=False)
+        except Exception as e:
+            raise ValueError(str(e)) from e
+        if not isinstance(data, dict):
+            raise ValueError("Frame must be a map")
+        return data
+
+    @staticmethod
+    def _default(value: Any):
+        if isinstance(value, (datetime, date)):
+            return to_millis(value)
+        if isinstance(value, (set, frozenset, tuple)):
+            return list(value)
+        raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+json_codec = JsonCodec()
+msgpack_codec = MsgpackCodec()
+
+def negotiate_codec(websocket: WebSocket) -> Union[JsonCodec, MsgpackCodec]:
+    """Chọn codec dựa trên subprotocol client đề xuất lúc handshake"""
+    offered = websocket.scope.get("subprotocols") or []
+    if MSGPACK_SUBPROTOCOL in offered:
+        if msgpack is None:
+            logger.warning("⚠️ Client requested MessagePack but msgpack is not installed, using JSON")
+        elif not settings.ws_binary_protocol_enabled:
+            logger.debug("Binary protocol disabled, using JSON")
+        else:
+            return msgpack_codec
+    return json_codec
@@ -1,15 +1,30 @@
 # server/src/api/routes.py
+import asyncio
 import logging
-from fastapi import APIRouter, HTTPException, Depends
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, UploadFile, File, Form, Query
+from fastapi.responses import StreamingResponse
 from telegram.client import telegram_manager
+from telegram.dialogs import dialog_index
+from telegram.filters import message_filter
+from telegram.media import media_cache, parse_range
+from telegram.search import search_index
+from telegram.pipeline import handler_pipeline
+from telegram.routing import message_router
+from telegram.snapshot import warm_snapshot
 from telegram.schemas import (
     SendMessageRequest, 
     SendMessageResponse, 
     ErrorResponse,
     TelegramUser,
-    ChatInfo
+    ChatInfo,
+    MonitorRules
 )
 from core.config import settings
+from .admission import admission, send_admission
+from .debug import require_debug_token
+from .cache import response_cache, etag_matches, chat_tag, TAG_CHATS, TAG_ME, TAG_MESSAGES
 
 logger = logging.getLogger(__name__)
 api_router = APIRouter()
@@ -26,7 +41,8 @@ async def get_telegram_client():
 @api_router.post("/send", response_model=SendMessageResponse)
 async def send_message(
     request: SendMessageRequest,
-    client = Depends(get_telegram_client)
+    client = Depends(get_telegram_client),
+    _slot = Depends(send_admission)
 ):
     """Gửi tin nhắn tới chat/user"""
     try:
@@ -54,18 +70,110 @@ async def send_message(
             detail=f"Failed to send message: {str(e)}"
         )
 
+WAVEFORM_SAMPLES = 100
+
+def _parse_waveform(raw: Optional[str]) -> Optional[bytes]:
+    """Waveform từ client: các giá trị 0-31 cách nhau bởi dấu phẩy, resample về 100 mẫu"""
+    if not raw:
+        return None
+    try:
+        values = [min(max(int(v), 0), 31) for v in raw.split(",") if v.strip()]
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Waveform must be comma-separated integers 0-31")
+    if not values:
+        return None
+    if len(values) > WAVEFORM_SAMPLES:
+        step = len(values) / WAVEFORM_SAMPLES
+        values = [values[int(i * step)] for i in range(WAVEFORM_SAMPLES)]
+    return bytes(values)
+
+@api_router.post("/send/file", response_model=SendMessageResponse)
+async def send_file(
+    chat_id: int = Form(..., description="ID của chat để gửi"),
+    file: UploadFile = File(..., description="File ghi âm / file đính kèm"),
+    voice_note: bool = Form(True, description="Gửi dưới dạng voice note"),
+    duration: Optional[int] = Form(None, ge=0, description="Thời lượng (giây)"),
+    waveform: Optional[str] = Form(None, description="Waveform 0-31, cách nhau bởi dấu phẩy"),
+    caption: str = Form("", max_length=1024, description="Chú thích"),
+    client = Depends(get_telegram_client)
+):
+    """Gửi voice note / file (multipart, upload được spool ra file tạm, không buffer vào RAM)
+    
+    Admission chạy ở UploadAdmissionMiddleware, trước khi body được đọc.
+    """
+    waveform_bytes = _parse_waveform(waveform)
+    try:
+        # UploadFile đã được spool ra file tạm trên đĩa khi parse multipart
+        file.file.seek(0, 2)
+        file_size = file.file.tell()
+        if file_size == 0:
+            raise HTTPException(status_code=422, detail="Uploaded file is empty")
+        
+        logger.info(f"📤 Sending {'voice note' if voice_note else 'file'} to chat {chat_id}: "
+                    f"{file.filename} ({file_size // 1024} KB)")
+        
+        sent_message = await telegram_manager.send_file_safe(
+            chat_id=chat_id,
+            file=file.file,
+            file_name=file.filename or ("voice.ogg" if voice_note else "file"),
+            file_size=file_size,
+            voice_note=voice_note,
+            duration=duration,
+            waveform=waveform_bytes,
+            mime_type=file.content_type,
+            caption=caption
+        )
+        
+        logger.info(f"✅ File sent successfully. ID: {sent_message.id}")
+        
+        return SendMessageResponse(
+            success=True,
+            message="File sent successfully",
+            message_id=sent_message.id,
+            chat_id=chat_id
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Failed to send file: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to send file: {str(e)}"
+        )
+    finally:
+        await file.close()
+
+# Các route đọc bên dưới đi qua response_cache: key theo route + tham số,
+# tag để handlers invalidate khi có sự kiện Telegram liên quan
+
+def me_query(client):
+    return ("me",), (TAG_ME,), lambda: load_me(client)
+
+def recent_chats_query(client, limit: int):
+    return ("chats", limit), (TAG_CHATS,), lambda: load_recent_chats(client, limit)
+
+def chat_messages_query(client, chat_id: int, limit: int):
+    return (
+        ("messages", chat_id, limit),
+        (TAG_MESSAGES, chat_tag(chat_id)),
+        lambda: load_chat_messages(client, chat_id, limit)
+    )
+
 @api_router.get("/me", response_model=TelegramUser)
-async def get_me(client = Depends(get_telegram_client)):
+async def get_me(request: Request, client = Depends(get_telegram_client)):
     """Lấy thông tin user hiện tại"""
+    return await response_cache.respond(request, *me_query(client))
+
+async def load_me(client) -> dict:
+    # Thông tin user đổi rất hiếm: dùng bản đã lưu (snapshot / lần gọi trước)
+    if warm_snapshot.me is not None:
+        return TelegramUser(**warm_snapshot.me).dict()
+    
     try:
         me = await client.get_me()
-        return TelegramUser(
-            id=me.id,
-            username=me.username,
-            first_name=me.first_name,
-            last_name=me.last_name,
-            phone=me.phone
-        )
+        warm_snapshot.record_me(me)
+        return TelegramUser(**warm_snapshot.me).dict()
     except Exception as e:
         logger.error(f"❌ Failed to get user info: {e}")
         raise HTTPException(
@@ -74,8 +182,16 @@ async def get_me(client = Depends(get_telegram_client)):
         )
 
 @api_router.get("/chats")
-async def get_recent_chats(client = Depends(get_telegram_client), limit: int = 20):
+async def get_recent_chats(request: Request, client = Depends(get_telegram_client), limit: int = 20):
     """Lấy danh sách chat gần đây"""
+    return await response_cache.respond(request, *recent_chats_query(client, limit))
+
+async def load_recent_chats(client, limit: int) -> dict:
+    # Trả lời từ dialog index trong bộ nhớ nếu đã sẵn sàng
+    if dialog_index.can_serve(limit):
+        dialogs = dialog_index.top(limit)
+        return {"chats": dialogs, "total": len(dialogs)}
+    
     try:
         dialogs = []
         async for dialog in client.iter_dialogs(limit=limit):
@@ -89,7 +205,7 @@ async def get_recent_chats(client = Depends(get_telegram_client), limit: int = 2
             
             # Thêm thông tin user nếu là chat riêng
             if dialog.is_user:
-                entity = await client.get_entity(dialog.id)
+                entity = dialog.entity
                 chat_info.update({
                     "username": getattr(entity, 'username', None),
                     "first_name": getattr(entity, 'first_name', None),
@@ -110,13 +226,23 @@ async def get_recent_chats(client = Depends(get_telegram_client), limit: int = 2
 @api_router.get("/chat/{chat_id}/messages")
 async def get_chat_messages(
     chat_id: int, 
+    request: Request,
     client = Depends(get_telegram_client),
     limit: int = 50
 ):
     """Lấy tin nhắn từ chat"""
+    return await response_cache.respond(request, *chat_messages_query(client, chat_id, limit))
+
+async def load_chat_messages(client, chat_id: int, limit: int) -> dict:
+    # Ngay sau restart: trả từ snapshot nếu chat chưa có gì mới
+    warm = warm_snapshot.warm_messages(chat_id, limit)
+    if warm is not None:
+        return {"messages": warm, "chat_id": chat_id, "total": len(warm)}
+    
     try:
         messages = []
         async for message in client.iter_messages(chat_id, limit=limit):
+            message_router.record(chat_id, message.id)
             sender_name = "Unknown"
             if message.sender:
                 if hasattr(message.sender, 'first_name'):
@@ -130,9 +256,11 @@ async def get_chat_messages(
                 "sender": sender_name,
                 "date": message.date.isoformat() if message.date else None,
                 "out": message.out,
-                "media": message.media is not None
+                "media": message.media is not None,
+                "media_url": f"/api/media/{chat_id}/{message.id}" if message.media is not None else None
             })
         
+        warm_snapshot.record_messages(chat_id, messages, limit)
         return {"messages": messages, "chat_id": chat_id, "total": len(messages)}
         
     except Exception as e:
@@ -142,6 +270,117 @@ async def get_chat_messages(
             detail=f"Failed to get messages: {str(e)}"
         )
 
+@api_router.get("/media/{chat_id}/{message_id}")
+async def get_media(
+    chat_id: int,
+    message_id: int,
+    request: Request,
+    client = Depends(get_telegram_client)
+):
+    """Stream media của tin nhắn (hỗ trợ HTTP Range, cache trên đĩa)"""
+    try:
+        ref = await media_cache.resolve(client, chat_id, message_id)
+    except Exception as e:
+        logger.error(f"❌ Failed to resolve media {chat_id}/{message_id}: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get media: {str(e)}"
+        )
+    
+    if ref is None:
+        raise HTTPException(status_code=404, detail="Message has no downloadable media")
+    
+    # File ID của Telegram không đổi nội dung nên dùng làm ETag mạnh
+    etag = f'"{ref.key}"'
+    headers = {
+        "Cache-Control": "private, max-age=86400",
+        "ETag": etag
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    # If-Range không khớp (hoặc là ngày, ta không có Last-Modified): trả cả file
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range.strip() != etag:
+        range_header = None
+    
+    try:
+        byte_range = parse_range(range_header, ref.size)
+    except ValueError:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{ref.size}"}
+        )
+    
+    if ref.size is not None:
+        headers["Accept-Ranges"] = "bytes"
+    
+    if byte_range is None:
+        start, end, status_code = 0, None, 200
+        if ref.size is not None:
+            headers["Content-Length"] = str(ref.size)
+    else:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{ref.size}"
+        headers["Content-Length"] = str(end - start + 1)
+    
+    stream = await media_cache.open_stream(client, ref, start, end)
+    return StreamingResponse(stream, status_code=status_code, media_type=ref.mime_type, headers=headers)
+
+@api_router.get("/search")
+async def search_messages(
+    q: str = Query(..., min_length=1, description="Từ khoá tìm kiếm"),
+    chat_id: Optional[int] = Query(None, description="Lọc theo chat"),
+    sender: Optional[str] = Query(None, description="Lọc theo tên người gửi"),
+    date_from: Optional[datetime] = Query(None, description="Từ thời điểm (ISO 8601)"),
+    date_to: Optional[datetime] = Query(None, description="Đến thời điểm (ISO 8601)"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100)
+):
+    """Tìm kiếm full-text trong tin nhắn đã nhận (index cục bộ, không gọi Telegram API)"""
+    if not search_index.ready:
+        raise HTTPException(status_code=503, detail="Search index not ready")
+    try:
+        return await search_index.search(
+            q, chat_id=chat_id, sender=sender,
+            date_from=date_from, date_to=date_to,
+            page=page, page_size=page_size
+        )
+    except Exception as e:
+        logger.error(f"❌ Search failed: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Search failed: {str(e)}"
+        )
+
+@api_router.get("/monitor/rules")
+async def get_monitor_rules():
+    """Rule theo dõi group/channel hiện tại"""
+    return {"rules": message_filter.rules.dict()["rules"], "stats": message_filter.stats()}
+
+@api_router.put("/monitor/rules", dependencies=[Depends(require_debug_token)])
+async def update_monitor_rules(rules: MonitorRules):
+    """Thay toàn bộ rule theo dõi; có hiệu lực ngay với update tiếp theo
+    
+    Rule quyết định tin group/channel nào được broadcast tới mọi client nên
+    cần token như /debug. Biên dịch và ghi file xong mới áp dụng: lỗi thì
+    rule cũ vẫn giữ nguyên.
+    """
+    try:
+        built = message_filter.build(rules)
+        await asyncio.to_thread(message_filter.save, rules)
+        message_filter.apply(rules, built)
+        return {"success": True, "stats": message_filter.stats()}
+    except Exception as e:
+        logger.error(f"❌ Failed to update monitor rules: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to update monitor rules: {str(e)}"
+        )
+
 @api_router.get("/status")
 async def get_status():
     """Lấy trạng thái hệ thống"""
@@ -153,6 +392,11 @@ async def get_status():
         "websocket": {
             "active_connections": len(getattr(telegram_manager, '_websocket_connections', []))
         },
+        "handlers": handler_pipeline.stats(),
+        "admission": admission.stats(),
+        "snapshot": warm_snapshot.stats(),
+        "response_cache": response_cache.stats(),
+        "monitor": message_filter.stats(),
         "config": {
             "debug": settings.debug,
             "app_name": settings.app_name
@@ -0,0 +1,177 @@
+# server/src/api/rpc.py
+import asyncio
+import logging
+import re
+from typing import Awaitable, Callable, Dict, Optional, Set
+from fastapi import HTTPException, WebSocket
+from pydantic import BaseModel, Field, ValidationError
+from telegram.schemas import SendMessageRequest
+
+logger = logging.getLogger(__name__)
+
+# Số request RPC đang chờ/chạy tối đa trên một connection
+MAX_INFLIGHT_PER_CONNECTION = 32
+
+class RpcError(Exception):
+    """Lỗi trả về cho client trong `rpc_error`"""
+
+    def __init__(self, code: str, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+class GetChatsParams(BaseModel):
+    limit: int = Field(20, ge=1, le=200, description="Số chat")
+
+class GetMessagesParams(BaseModel):
+    chat_id: int = Field(..., description="ID của chat")
+    limit: int = Field(50, ge=1, le=200, description="Số tin nhắn")
+
+class CommandParams(BaseModel):
+    text: str = Field(..., min_length=1, max_length=4096, description="Lệnh dạng văn bản (từ giọng nói)")
+
+async def _get_client():
+    from telegram.client import telegram_manager
+    if not telegram_manager.is_connected:
+        raise RpcError("unavailable", "Telegram client not connected")
+    return telegram_manager.client
+
+async def rpc_send(params: SendMessageRequest) -> dict:
+    """Gửi tin nhắn (giống POST /api/send)"""
+    from telegram.client import telegram_manager
+    from api.admission import admission, Overloaded
+    await _get_client()
+    try:
+        async with admission.send_slot():
+            sent_message = await telegram_manager.send_message_safe(chat_id=params.chat_id, message=params.text)
+    except Overloaded as e:
+        raise RpcError("overloaded", f"Server busy: {e.reason}")
+    return {"message_id": sent_message.id, "chat_id": params.chat_id}
+
+async def rpc_get_chats(params: GetChatsParams) -> dict:
+    """Danh sách chat gần đây (giống GET /api/chats, dùng chung response cache)"""
+    from api.cache import response_cache
+    from api.routes import recent_chats_query
+    entry = await response_cache.fetch(*recent_chats_query(await _get_client(), params.limit))
+    return entry.data
+
+async def rpc_get_messages(params: GetMessagesParams) -> dict:
+    """Tin nhắn trong chat (giống GET /api/chat/{id}/messages, dùng chung response cache)"""
+    from api.cache import response_cache
+    from api.routes import chat_messages_query
+    entry = await response_cache.fetch(*chat_messages_query(await _get_client(), params.chat_id, params.limit))
+    return entry.data
+
+_REPLY_RE = re.compile(r"^(?:reply to|trả lời)\s+(.+)$", re.IGNORECASE)
+_LIST_RE = re.compile(r"\b(?:list|liệt kê|hiển thị)\b", re.IGNORECASE)
+
+async def rpc_command(params: CommandParams) -> dict:
+    """Lệnh văn bản: "reply to <tên> <nội dung>" hoặc "list"
+
+    Tên được khớp (bỏ dấu) với các chat riêng trong dialog index, ưu tiên
+    tên nhiều từ nhất khớp ở đầu câu. Khớp theo từng từ của chính câu gốc
+    nên phần còn lại sau tên luôn là nội dung tin.
+    """
+    from telegram.dialogs import dialog_index
+    from telegram.search import fold_text
+
+    text = params.text.strip()
+    match = _REPLY_RE.match(text)
+    if match:
+        rest = match.group(1)
+        folded_words = [fold_text(word) for word in rest.split()]
+        best = None
+        for chat in dialog_index.top(dialog_index.capacity):
+            if chat["type"] != "private":
+                continue
+            for name in (chat.get("title"), chat.get("first_name")):
+                name_words = fold_text(name or "").split()
+                if (name_words and folded_words[:len(name_words)] == name_words
+                        and (best is None or len(name_words) > best[1])):
+                    best = (chat, len(name_words))
+        if best is None:
+            raise RpcError("not_found", "No chat matches that name")
+        chat, name_words = best
+        parts = rest.split(maxsplit=name_words)
+        if len(parts) <= name_words:
+            raise RpcError("invalid_params", "No message text after the chat name")
+        body = parts[name_words]
+        result = await rpc_send(SendMessageRequest(chat_id=chat["id"], text=body))
+        return {"action": "reply", "chat": chat["title"], **result}
+
+    if _LIST_RE.search(text):
+        return {"action": "list", **(await rpc_get_chats(GetChatsParams(limit=5)))}
+
+    raise RpcError("unknown_command", "Command not recognized")
+
+# method -> (handler, params model, số request đồng thời tối đa mỗi connection)
+RPC_METHODS: Dict[str, tuple] = {
+    "send": (rpc_send, SendMessageRequest, 4),
+    "get_chats": (rpc_get_chats, GetChatsParams, 2),
+    "get_messages": (rpc_get_messages, GetMessagesParams, 4),
+    "command": (rpc_command, CommandParams, 2),
+}
+
+class RpcSession:
+    """Trạng thái RPC của một connection: giới hạn đồng thời theo method, các task đang chạy
+
+    Mỗi request chạy trong task riêng nên client có thể pipeline nhiều
+    request; response khớp theo `id` và có thể về không theo thứ tự.
+    """
+
+    def __init__(self, websocket: WebSocket, send: Callable[[WebSocket, dict], Awaitable[None]]):
+        self.websocket = websocket
+        self._send = send
+        self._semaphores = {name: asyncio.Semaphore(limit) for name, (_, _, limit) in RPC_METHODS.items()}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def dispatch(self, message: dict):
+        """Nhận một frame {"type": "rpc", "id", "method", "params"} và chạy ở background"""
+        request_id = message.get("id")
+        if len(self._tasks) >= MAX_INFLIGHT_PER_CONNECTION:
+            self._spawn(self._reply_error(request_id, RpcError("too_many_requests", "Too many in-flight requests")))
+            return
+        self._spawn(self._run(request_id, message.get("method"), message.get("params") or {}))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, request_id, method: Optional[str], params: dict):
+        if method not in RPC_METHODS:
+            await self._reply_error(request_id, RpcError("method_not_found", f"Unknown method: {method}"))
+            return
+        if not isinstance(params, dict):
+            await self._reply_error(request_id, RpcError("invalid_params", "params must be an object"))
+            return
+        handler, params_model, _ = RPC_METHODS[method]
+        try:
+            parsed = params_model(**params)
+            async with self._semaphores[method]:
+                result = await handler(parsed)
+            await self._send(self.websocket, {"type": "rpc_result", "id": request_id, "result": result})
+        except asyncio.CancelledError:
+            raise
+        except ValidationError as e:
+            await self._reply_error(request_id, RpcError("invalid_params", str(e)))
+        except RpcError as e:
+            await self._reply_error(request_id, e)
+        except HTTPException as e:
+            await self._reply_error(request_id, RpcError(f"http_{e.status_code}", str(e.detail)))
+        except Exception as e:
+            logger.error(f"❌ RPC {method} failed: {e}")
+            await self._reply_error(request_id, RpcError("internal_error", str(e)))
+
+    async def _reply_error(self, request_id, error: RpcError):
+        await self._send(self.websocket, {
+            "type": "rpc_error",
+            "id": request_id,
+            "error": {"code": error.code, "message": error.message}
+        })
+
+    def close(self):
+        """Huỷ các request còn dang dở khi connection đóng"""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
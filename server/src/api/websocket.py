@@ -1,9 +1,11 @@
 # server/src/api/websocket.py
-import json
 import logging
-from typing import List, Set
+from typing import Dict, List, Set
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from telegram.schemas import WebSocketMessage
+from .protocol import Frame, negotiate_codec, json_codec
+from .rpc import RpcSession
+from .admission import admission, Overloaded, WS_CLOSE_OVERLOADED, WS_CLOSE_POLICY
 
 logger = logging.getLogger(__name__)
 websocket_router = APIRouter()
@@ -13,34 +15,40 @@ class WebSocketManager:
     
     def __init__(self):
         self.active_connections: Set[WebSocket] = set()
+        self.codecs: Dict[WebSocket, object] = {}
         self.connection_count = 0
     
     async def connect(self, websocket: WebSocket):
         """Chấp nhận WebSocket connection"""
-        await websocket.accept()
+        codec = negotiate_codec(websocket)
+        await websocket.accept(subprotocol=codec.subprotocol)
         self.active_connections.add(websocket)
+        self.codecs[websocket] = codec
         self.connection_count += 1
         
-        logger.info(f"🔌 WebSocket connected. Total: {len(self.active_connections)}")
+        logger.info(f"🔌 WebSocket connected ({codec.name}). Total: {len(self.active_connections)}")
         
         # Gửi welcome message
         await self.send_personal_message(websocket, {
             "type": "connection",
             "message": "WebSocket connected successfully",
-            "connection_id": self.connection_count
+            "connection_id": self.connection_count,
+            "protocol": codec.name
         })
     
     def disconnect(self, websocket: WebSocket):
         """Ngắt kết nối WebSocket"""
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
+        self.codecs.pop(websocket, None)
         logger.info(f"🔌 WebSocket disconnected. Total: {len(self.active_connections)}")
     
     async def send_personal_message(self, websocket: WebSocket, data: dict):
         """Gửi message tới một WebSocket cụ thể"""
         try:
             message = WebSocketMessage(type=data.get("type", "message"), data=data)
-            await websocket.send_text(message.json())
+            codec = self.codec_for(websocket)
+            await self._send_frame(websocket, codec.encode(message))
         except Exception as e:
             logger.error(f"❌ Failed to send personal message: {e}")
             self.disconnect(websocket)
@@ -55,7 +63,8 @@ class WebSocketManager:
             type=data.get("type", "telegram_message"), 
             data=data
         )
-        message_text = message.json()
+        # Encode một lần cho mỗi codec, không phải mỗi connection
+        frames: Dict[str, Frame] = {}
         
         # Track failed connections để remove
         failed_connections = set()
@@ -63,7 +72,11 @@ class WebSocketManager:
         
         for connection in self.active_connections.copy():  # Copy để tránh modify during iteration
             try:
-                await connection.send_text(message_text)
+                codec = self.codec_for(connection)
+                frame = frames.get(codec.name)
+                if frame is None:
+                    frame = frames[codec.name] = codec.encode(message)
+                await self._send_frame(connection, frame)
                 successful_broadcasts += 1
             except Exception as e:
                 logger.warning(f"⚠️ Failed to broadcast to connection: {e}")
@@ -84,6 +97,26 @@ class WebSocketManager:
             "timestamp": None  # Sẽ được tự động thêm bởi WebSocketMessage
         })
     
+    def codec_for(self, websocket: WebSocket):
+        """Codec đã thương lượng cho connection (mặc định JSON)"""
+        return self.codecs.get(websocket, json_codec)
+    
+    async def _send_frame(self, websocket: WebSocket, frame: Frame):
+        """Gửi frame đã encode: bytes -> binary frame, str -> text frame"""
+        if isinstance(frame, bytes):
+            await websocket.send_bytes(frame)
+        else:
+            await websocket.send_text(frame)
+    
+    async def receive_frame(self, websocket: WebSocket) -> Frame:
+        """Nhận một frame text hoặc binary từ client"""
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        if message.get("text") is not None:
+            return message["text"]
+        return message.get("bytes") or b""
+    
     @property
     def connection_count_active(self) -> int:
         """Số lượng connections hiện tại"""
@@ -92,47 +125,90 @@ class WebSocketManager:
 # Singleton instance
 websocket_manager = WebSocketManager()
 
+async def handle_heartbeat(websocket: WebSocket, message_data: dict, session: RpcSession):
+    await websocket_manager.send_personal_message(websocket, {
+        "type": "heartbeat_response",
+        "message": "pong",
+        "timestamp": None
+    })
+
+async def handle_get_status(websocket: WebSocket, message_data: dict, session: RpcSession):
+    # Gửi trạng thái hiện tại
+    from telegram.client import telegram_manager
+    await websocket_manager.send_personal_message(websocket, {
+        "type": "status",
+        "telegram_connected": telegram_manager.is_connected,
+        "active_connections": websocket_manager.connection_count_active,
+        "protocol": websocket_manager.codec_for(websocket).name
+    })
+
+async def handle_echo(websocket: WebSocket, message_data: dict, session: RpcSession):
+    # Echo message để test
+    await websocket_manager.send_personal_message(websocket, {
+        "type": "echo_response",
+        "original_message": message_data.get("message", ""),
+        "timestamp": None
+    })
+
+async def handle_rpc(websocket: WebSocket, message_data: dict, session: RpcSession):
+    # Chạy ở background, response khớp theo id (xem api/rpc.py)
+    session.dispatch(message_data)
+
+# message type -> handler
+MESSAGE_HANDLERS = {
+    "heartbeat": handle_heartbeat,
+    "get_status": handle_get_status,
+    "echo": handle_echo,
+    "rpc": handle_rpc,
+}
+
 @websocket_router.websocket("")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint chính"""
-    await websocket_manager.connect(websocket)
+    try:
+        client_ip = admission.admit_connection(websocket)
+    except Overloaded as e:
+        # Close trước accept bị Starlette đổi thành HTTP 403; accept rồi mới
+        # close để client nhận được mã 1013 (Try Again Later)
+        await websocket.accept()
+        await websocket.close(code=WS_CLOSE_OVERLOADED, reason=e.reason)
+        return
+    
+    session = RpcSession(websocket, websocket_manager.send_personal_message)
+    limiter = admission.message_limiter()
     
     try:
+        await websocket_manager.connect(websocket)
+        
         while True:
-            # Nhận message từ client (heartbeat, commands, etc.)
-            data = await websocket.receive_text()
+            # Nhận message từ client (heartbeat, commands, rpc, etc.)
+            data = await websocket_manager.receive_frame(websocket)
+            codec = websocket_manager.codec_for(websocket)
+            
+            if not limiter.take():
+                # Một lỗi mỗi cửa sổ, không phải mỗi frame: không khuếch đại flood
+                if limiter.record_drop():
+                    await websocket_manager.send_personal_message(websocket, {
+                        "type": "error",
+                        "message": "Rate limit exceeded, messages dropped"
+                    })
+                if limiter.abusive:
+                    logger.warning(f"⚠️ Closing WebSocket from {client_ip}: sustained rate limit abuse")
+                    admission.rejected["ws message rate"] += 1
+                    websocket_manager.disconnect(websocket)
+                    await websocket.close(code=WS_CLOSE_POLICY, reason="Message rate limit exceeded")
+                    return
+                continue
             
             try:
-                message_data = json.loads(data)
+                message_data = codec.decode(data)
                 message_type = message_data.get("type", "unknown")
                 
                 logger.debug(f"📥 Received WebSocket message: {message_type}")
                 
-                # Handle different message types
-                if message_type == "heartbeat":
-                    await websocket_manager.send_personal_message(websocket, {
-                        "type": "heartbeat_response",
-                        "message": "pong",
-                        "timestamp": None
-                    })
-                
-                elif message_type == "get_status":
-                    # Gửi trạng thái hiện tại
-                    from telegram.client import telegram_manager
-                    await websocket_manager.send_personal_message(websocket, {
-                        "type": "status",
-                        "telegram_connected": telegram_manager.is_connected,
-                        "active_connections": websocket_manager.connection_count_active
-                    })
-                
-                elif message_type == "echo":
-                    # Echo message để test
-                    await websocket_manager.send_personal_message(websocket, {
-                        "type": "echo_response",
-                        "original_message": message_data.get("message", ""),
-                        "timestamp": None
-                    })
-                
+                handler = MESSAGE_HANDLERS.get(message_type)
+                if handler is not None:
+                    await handler(websocket, message_data, session)
                 else:
                     logger.warning(f"⚠️ Unknown WebSocket message type: {message_type}")
                     await websocket_manager.send_personal_message(websocket, {
@@ -140,11 +216,11 @@ async def websocket_endpoint(websocket: WebSocket):
                         "message": f"Unknown message type: {message_type}"
                     })
                     
-            except json.JSONDecodeError:
-                logger.warning(f"⚠️ Invalid JSON received: {data[:100]}...")
+            except ValueError:
+                logger.warning(f"⚠️ Invalid {codec.name} frame received: {data[:100]}...")
                 await websocket_manager.send_personal_message(websocket, {
                     "type": "error",
-                    "message": "Invalid JSON format"
+                    "message": codec.invalid_message
                 })
             
     except WebSocketDisconnect:
@@ -153,4 +229,8 @@ async def websocket_endpoint(websocket: WebSocket):
         
     except Exception as e:
         logger.error(f"❌ WebSocket error: {e}", exc_info=True)
-        websocket_manager.disconnect(websocket)
\ No newline at end of file
+        websocket_manager.disconnect(websocket)
+    
+    finally:
+        session.close()
+        admission.release_connection(client_ip)
\ No newline at end of file
@@ -1,5 +1,6 @@
 
 # server/src/core/config.py
+from typing import Optional
 from pydantic import Field
 from pydantic_settings import BaseSettings
 import os
@@ -25,6 +26,78 @@ class Settings(BaseSettings):
     # Security
     secret_key: str = Field(..., description="Secret key cho JWT")
     
+    # WebSocket wire protocol
+    ws_binary_protocol_enabled: bool = Field(True, description="Cho phép client chọn MessagePack qua subprotocol")
+    ws_compression_enabled: bool = Field(True, description="Bật permessage-deflate cho /ws")
+    ws_compression_level: int = Field(6, ge=1, le=9, description="Mức nén zlib")
+    ws_compression_mem_level: int = Field(5, ge=1, le=9, description="zlib memLevel (bộ nhớ mỗi connection)")
+    ws_compression_window_bits: int = Field(12, ge=9, le=15, description="Cửa sổ LZ77 phía server (2^bits bytes)")
+    
+    # Media proxy
+    media_cache_dir: str = Field("./media_cache", description="Thư mục cache media đã tải")
+    media_cache_max_mb: int = Field(1024, description="Dung lượng cache media tối đa (MB)")
+    media_chunk_size: int = Field(512 * 1024, description="Kích thước chunk khi tải từ Telegram")
+    
+    # Tự động chuyển voice message thành văn bản
+    transcription_enabled: bool = Field(False, description="Bật transcription cho voice/audio đến")
+    transcription_backend: str = Field("stub", description="Recognizer: stub | huggingface")
+    transcription_model: str = Field("openai/whisper-large-v3", description="Model Hugging Face")
+    hf_token: Optional[str] = Field(None, description="Hugging Face API token")
+    transcription_concurrency: int = Field(2, description="Số transcription chạy đồng thời")
+    transcription_max_pending: int = Field(50, description="Số voice chờ tối đa, vượt thì bỏ qua")
+    transcription_cache_size: int = Field(2048, description="Số kết quả giữ trong cache theo document ID")
+    
+    # Full-text search
+    search_enabled: bool = Field(True, description="Bật index tìm kiếm tin nhắn (SQLite FTS5)")
+    search_db_path: str = Field("./data/search.db", description="File SQLite của search index")
+    search_backfill_chats: int = Field(50, description="Số chat riêng được backfill")
+    search_backfill_messages: int = Field(500, description="Số tin backfill mỗi chat")
+    
+    # Event handler pipeline
+    handler_workers: int = Field(4, description="Số worker xử lý event Telegram")
+    handler_queue_size: int = Field(1000, description="Kích thước queue mỗi worker")
+    handle_user_updates: bool = Field(False, description="Đăng ký UserUpdate (online/offline)")
+    
+    # Định tuyến / debounce sự kiện edit-delete
+    message_router_size: int = Field(50000, description="Số message_id -> chat_id giữ trong index")
+    edit_debounce_ms: int = Field(400, description="Cửa sổ gộp edit liên tiếp (0 = tắt)")
+    edit_debounce_max_ms: int = Field(2000, description="Thời gian chờ tối đa trước khi phát edit")
+    
+    # Admission control / load shedding
+    admission_max_connections: int = Field(200, description="Tổng số WebSocket tối đa")
+    admission_max_connections_per_ip: int = Field(10, description="Số WebSocket tối đa mỗi IP")
+    admission_max_inflight_sends: int = Field(16, description="Số lượt gửi tin chạy đồng thời tối đa")
+    admission_retry_after: int = Field(5, description="Giá trị Retry-After (giây) khi từ chối")
+    admission_trust_forwarded: bool = Field(False, description="Lấy IP từ X-Forwarded-For (sau proxy tin cậy)")
+    ws_message_rate: float = Field(20.0, description="Số message/giây mỗi WebSocket")
+    ws_message_burst: int = Field(40, description="Burst message mỗi WebSocket")
+    overload_queue_depth: int = Field(2000, description="Độ sâu queue handler coi là quá tải")
+    overload_loop_lag_ms: float = Field(500.0, description="Độ trễ event loop (ms) coi là quá tải")
+    
+    # Diagnostics (/debug)
+    debug_token: Optional[str] = Field(None, description="Token cho /debug (không đặt = tắt /debug)")
+    slow_callback_ms: float = Field(100.0, description="Ngưỡng ghi nhận event loop bị chặn (0 = tắt)")
+    
+    # Warm-start snapshot
+    snapshot_enabled: bool = Field(True, description="Ghi/nạp snapshot trạng thái nóng qua các lần restart")
+    snapshot_path: str = Field("./data/snapshot.json", description="Đường dẫn file snapshot")
+    snapshot_interval: int = Field(300, description="Chu kỳ ghi snapshot khi đang chạy (giây)")
+    snapshot_chats: int = Field(50, description="Số chat giữ tin nhắn gần đây trong snapshot")
+    snapshot_messages_per_chat: int = Field(50, description="Số tin nhắn mỗi chat trong snapshot")
+    snapshot_warm_ttl: int = Field(600, description="Thời gian (giây) sau khởi động còn trả tin nhắn từ snapshot")
+    
+    # Ghi trace update (record-and-replay)
+    trace_path: Optional[str] = Field(None, description="File ghi trace ẩn danh của update đến (.gz = nén; không đặt = tắt)")
+    trace_max_events: int = Field(1000000, description="Số event tối đa ghi vào trace")
+    
+    # Response cache cho các route GET (ETag / 304)
+    response_cache_size: int = Field(512, description="Số response giữ trong cache")
+    response_cache_ttl: int = Field(300, description="TTL dự phòng (giây); invalidate chính theo sự kiện Telegram")
+    
+    # Theo dõi group/channel (rule lọc tin)
+    monitor_rules_path: str = Field("./data/monitor_rules.json", description="File rule theo dõi group/channel")
+    monitor_rules: Optional[str] = Field(None, description="Rule dạng JSON, dùng khi chưa có file rule")
+    
     # CORS
     allowed_origins: list = Field(
         default=["*"], 
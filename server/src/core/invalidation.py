@@ -0,0 +1,36 @@
+# server/src/core/invalidation.py
+import logging
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+# Tag invalidation: danh sách chat, user hiện tại, lịch sử mọi chat, lịch sử một chat
+TAG_CHATS = "chats"
+TAG_ME = "me"
+TAG_MESSAGES = "messages"
+
+def chat_tag(chat_id: int) -> str:
+    return f"chat:{chat_id}"
+
+class InvalidationHub:
+    """Phát tín hiệu "dữ liệu có tag này đã đổi" từ tầng telegram
+
+    Tầng telegram chỉ gọi invalidate(tag); các cache ở tầng api (vd.
+    response_cache) tự đăng ký nhận, nên telegram không phụ thuộc api.
+    """
+
+    def __init__(self):
+        self._subscribers: List[Callable[..., None]] = []
+
+    def subscribe(self, callback: Callable[..., None]):
+        self._subscribers.append(callback)
+
+    def invalidate(self, *tags: str):
+        for callback in self._subscribers:
+            try:
+                callback(*tags)
+            except Exception as e:
+                logger.error(f"❌ Invalidation subscriber failed for {tags}: {e}")
+
+# Singleton instance
+invalidation = InvalidationHub()
@@ -0,0 +1,114 @@
+# server/src/core/monitor.py
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import List, Optional
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def format_thread_stack(thread_id: int, limit: int = 30) -> List[str]:
+    """Stack hiện tại của một thread (dùng cho watchdog / profiler)"""
+    frame = sys._current_frames().get(thread_id)
+    if frame is None:
+        return []
+    return [line.rstrip() for line in traceback.format_stack(frame, limit=limit)]
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+class LoopLagMonitor:
+    """Đo độ trễ event loop: ngủ `interval` giây và xem thức dậy muộn bao nhiêu
+
+    Giữ lịch sử mẫu để tính percentile. Một watchdog thread theo dõi nhịp
+    của task này: nếu loop bị chặn quá `slow_threshold`, nó chụp stack của
+    thread chạy loop ngay lúc đang bị chặn — chính là callback chậm. Cách
+    này chạy được với cả asyncio thuần lẫn uvloop.
+    """
+
+    def __init__(self, interval: float = 0.1, history: int = 3000, slow_threshold: float = 0.1):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.lag = 0.0
+        self.samples: deque = deque(maxlen=history)
+        self.slow_callbacks: deque = deque(maxlen=50)
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._current_stall: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop_watchdog = threading.Event()
+
+    def start(self):
+        if self._task is None:
+            self._loop_thread_id = threading.get_ident()
+            self._heartbeat = time.monotonic()
+            self._task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+            if self.slow_threshold > 0:
+                self._stop_watchdog.clear()
+                self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+                self._watchdog.start()
+
+    async def stop(self):
+        self._stop_watchdog.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - started - self.interval)
+            self.samples.append(self.lag * 1000)
+            self._heartbeat = time.monotonic()
+            stall = self._current_stall
+            if stall is not None:
+                stall["duration_ms"] = round(self.lag * 1000, 2)
+                self._current_stall = None
+
+    def _watch(self):
+        """Watchdog thread: phát hiện loop bị chặn và chụp stack"""
+        check_every = max(self.slow_threshold / 4, 0.005)
+        while not self._stop_watchdog.wait(check_every):
+            blocked_for = time.monotonic() - self._heartbeat - self.interval
+            if blocked_for < self.slow_threshold or self._current_stall is not None:
+                continue
+            stall = {
+                "detected_at": time.time(),
+                "blocked_ms_at_detection": round(blocked_for * 1000, 2),
+                "duration_ms": None,
+                "stack": format_thread_stack(self._loop_thread_id)
+            }
+            self._current_stall = stall
+            self.slow_callbacks.append(stall)
+            logger.warning(f"🐢 Event loop blocked for {blocked_for * 1000:.0f}ms")
+
+    @property
+    def lag_ms(self) -> float:
+        return self.lag * 1000
+
+    def percentiles(self) -> dict:
+        values = sorted(self.samples)
+        return {
+            "samples": len(values),
+            "p50_ms": round(percentile(values, 0.50), 2),
+            "p90_ms": round(percentile(values, 0.90), 2),
+            "p99_ms": round(percentile(values, 0.99), 2),
+            "max_ms": round(values[-1], 2) if values else 0.0
+        }
+
+# Singleton instance
+loop_monitor = LoopLagMonitor(slow_threshold=settings.slow_callback_ms / 1000)
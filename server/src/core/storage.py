@@ -0,0 +1,18 @@
+# server/src/core/storage.py
+import os
+from pathlib import Path
+
+def write_atomic(path: Path, data: bytes, mode: int = 0o600):
+    """Ghi file an toàn khi crash: ghi ra file tạm, fsync, rồi rename đè
+
+    Mặc định chỉ chủ sở hữu đọc được (snapshot/session chứa access_hash).
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    os.fchmod(fd, mode)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -7,10 +7,21 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from telegram.client import telegram_manager
+from telegram.dialogs import dialog_index
+from telegram.media import media_cache
+from telegram.search import search_index
+from telegram.pipeline import handler_pipeline
+from telegram.routing import edit_debouncer
+from telegram.snapshot import warm_snapshot
+from telegram.trace import trace_recorder
+from telegram.transcription import transcription_service
 from api.websocket import websocket_router
 from api.routes import api_router
+from api.debug import debug_router
+from api.admission import UploadAdmissionMiddleware
 from core.config import settings
 from core.logging import setup_logging
+from core.monitor import loop_monitor
 
 # Setup logging
 setup_logging()
@@ -27,6 +38,13 @@ async def lifespan(app: FastAPI):
     
     logger.info("🚀 Starting Telegram Voice Reply Server...")
     
+    # Đo độ trễ event loop (dùng cho admission control)
+    loop_monitor.start()
+    
+    # Nạp snapshot trước khi kết nối: request đầu tiên trả lời từ trạng thái nóng
+    if settings.snapshot_enabled:
+        await warm_snapshot.load()
+    
     try:
         # Khởi tạo Telegram client với timeout
         logger.info("🔄 Initializing Telegram client...")
@@ -38,6 +56,16 @@ async def lifespan(app: FastAPI):
         await register_handlers(telegram_manager.client)
         logger.info("✅ Event handlers registered")
         
+        # Nạp dialog index ở background (không chặn startup)
+        await dialog_index.start(telegram_manager.client)
+        
+        if settings.snapshot_enabled:
+            await warm_snapshot.start(telegram_manager.client)
+        
+        # Search index: mở DB, backfill lịch sử ở background
+        if settings.search_enabled:
+            await search_index.start(telegram_manager.client)
+        
         app_initialized = True
         logger.info("🎉 Application initialization completed successfully")
         
@@ -63,6 +91,19 @@ async def lifespan(app: FastAPI):
         # Cleanup
         logger.info("🔄 Shutting down...")
         try:
+            # Edit đang debounce vào pipeline, pipeline xử lý nốt queue trước khi dừng
+            await edit_debouncer.flush()
+            await handler_pipeline.stop()
+            if settings.snapshot_enabled:
+                await warm_snapshot.stop()
+            await dialog_index.stop()
+            await search_index.stop()
+            if trace_recorder:
+                await trace_recorder.stop()
+            if transcription_service:
+                await transcription_service.stop()
+            await media_cache.stop()
+            await loop_monitor.stop()
             if telegram_manager.is_connected:
                 await telegram_manager.disconnect()
                 logger.info("✅ Telegram client disconnected")
@@ -77,6 +118,10 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Admission cho upload trước khi FastAPI đọc multipart body
+# (thêm trước CORS để response 503 vẫn có header CORS)
+app.add_middleware(UploadAdmissionMiddleware, paths=("/api/send/file",))
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -180,6 +225,7 @@ async def global_exception_handler(request: Request, exc: Exception):
 # Include routers
 app.include_router(websocket_router, prefix="/ws")
 app.include_router(api_router, prefix="/api")
+app.include_router(debug_router, prefix="/debug")
 
 # Startup event logging
 @app.on_event("startup")
@@ -198,11 +244,16 @@ if __name__ == "__main__":
     
     logger.info(f"🚀 Starting server on 0.0.0.0:{port}")
     
+    # permessage-deflate tinh chỉnh cho /ws (xem api/compression.py)
+    from api.compression import TunedWebSocketProtocol
+    
     uvicorn.run(
         "main:app",
         host="0.0.0.0",  # Must be 0.0.0.0 for Railway
         port=port,       # Use Railway's dynamic port
         reload=False,    # Disable reload in production
         log_level="info",
+        ws=TunedWebSocketProtocol,
+        ws_per_message_deflate=settings.ws_compression_enabled,
         workers=1        # Single worker for Railway
     )
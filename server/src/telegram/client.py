@@ -2,10 +2,13 @@
 import asyncio
 import logging
 from typing import Optional
-from telethon import TelegramClient, events
+from telethon import TelegramClient, events, utils
 from telethon.sessions import StringSession
 from telethon.errors import FloodWaitError, SessionPasswordNeededError
+from telethon.tl.types import DocumentAttributeAudio
 from .config import telegram_settings
+from .routing import message_router
+from .session import BufferedFileSession
 
 logger = logging.getLogger(__name__)
 
@@ -40,17 +43,25 @@ class TelegramClientManager:
             if telegram_settings.session_string:
                 logger.info("Sử dụng StringSession từ biến môi trường")
                 session = StringSession(telegram_settings.session_string)
+            elif telegram_settings.session_buffered:
+                session_file = f"{telegram_settings.session_dir}/session.json"
+                logger.info(f"Sử dụng file session (ghi nền): {session_file}")
+                session = BufferedFileSession(session_file, telegram_settings.session_flush_interval)
             else:
                 session_file = f"{telegram_settings.session_dir}/session"
                 logger.info(f"Sử dụng file session: {session_file}")
                 session = session_file
                 
             # Tạo client
+            # sequential_updates: update được dispatch lần lượt, nên khi queue
+            # của handler_pipeline đầy thì vòng update của Telethon dừng lại chờ
+            # (thay vì mỗi update một task chờ put) và thứ tự trong chat được giữ
             self._client = TelegramClient(
                 session,
                 telegram_settings.api_id,
                 telegram_settings.api_hash,
-                flood_sleep_threshold=telegram_settings.flood_sleep_threshold
+                flood_sleep_threshold=telegram_settings.flood_sleep_threshold,
+                sequential_updates=True
             )
             
             # Kết nối
@@ -77,12 +88,66 @@ class TelegramClientManager:
             
     async def send_message_safe(self, chat_id: int, message: str, max_retries: int = 3):
         """Gửi tin nhắn với retry logic"""
+        sent_message = await self._with_retry(
+            lambda: self._client.send_message(chat_id, message),
+            max_retries=max_retries
+        )
+        message_router.record(chat_id, sent_message.id)
+        return sent_message
+    
+    async def send_file_safe(
+        self,
+        chat_id: int,
+        file,
+        file_name: str,
+        file_size: int,
+        voice_note: bool = True,
+        duration: Optional[int] = None,
+        waveform: Optional[bytes] = None,
+        mime_type: Optional[str] = None,
+        caption: str = "",
+        max_retries: int = 3
+    ):
+        """Upload file theo từng part (không đọc hết vào RAM) rồi gửi, cùng retry logic
+        
+        `file` là file object seek được (ví dụ file tạm của upload multipart).
+        """
+        async def upload():
+            file.seek(0)
+            return await self._client.upload_file(file, file_name=file_name, file_size=file_size)
+        
+        uploaded = await self._with_retry(upload, max_retries=max_retries)
+        
+        attributes = []
+        if voice_note:
+            attributes.append(DocumentAttributeAudio(
+                duration=duration or 0,
+                voice=True,
+                waveform=utils.encode_waveform(waveform) if waveform else None
+            ))
+        
+        sent_message = await self._with_retry(
+            lambda: self._client.send_file(
+                chat_id,
+                uploaded,
+                caption=caption,
+                voice_note=voice_note,
+                mime_type=mime_type,
+                attributes=attributes or None
+            ),
+            max_retries=max_retries
+        )
+        message_router.record(chat_id, sent_message.id)
+        return sent_message
+    
+    async def _with_retry(self, operation, max_retries: int = 3):
+        """Chạy một thao tác Telegram với xử lý FloodWait và exponential backoff"""
         if not self.is_connected:
             raise Exception("Telegram client chưa kết nối")
             
         for attempt in range(max_retries):
             try:
-                return await self._client.send_message(chat_id, message)
+                return await operation()
             except FloodWaitError as e:
                 if attempt == max_retries - 1:
                     raise
@@ -10,11 +10,17 @@ class TelegramSettings(BaseSettings):
     phone: str = Field(..., env="TELEGRAM_PHONE")
     session_string: str = Field(None, env="TELEGRAM_SESSION_STRING")
     session_dir: str = Field("./sessions", env="TELEGRAM_SESSION_DIR")
+    session_buffered: bool = Field(True, description="File session trong bộ nhớ, ghi nền theo lô (False = SQLite của Telethon)")
+    session_flush_interval: float = Field(5.0, description="Chu kỳ ghi session xuống đĩa (giây)")
     
     # Rate limiting
     max_requests_per_second: int = Field(20, description="Giới hạn request/giây")
     flood_sleep_threshold: int = Field(60, description="Ngưỡng flood sleep")
     
+    # Dialog index trong bộ nhớ
+    dialog_index_size: int = Field(200, description="Số dialog tối đa giữ trong index")
+    dialog_reconcile_interval: int = Field(300, description="Chu kỳ đối chiếu index với Telegram (giây)")
+    
     class Config:
         env_file = ".env"
         env_prefix = "TELEGRAM_"
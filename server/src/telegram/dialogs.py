@@ -0,0 +1,266 @@
+# server/src/telegram/dialogs.py
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+from core.invalidation import invalidation, chat_tag, TAG_CHATS
+from .config import telegram_settings
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_LENGTH = 100
+# Các trường mô tả chat (không phải trạng thái tin nhắn) của một entry
+IDENTITY_FIELDS = ("title", "type", "username", "first_name", "last_name")
+
+def display_name(entity) -> str:
+    """Tên hiển thị của user/chat/channel"""
+    if entity is None:
+        return "Unknown"
+    title = getattr(entity, 'title', None)
+    if title:
+        return title
+    name = f"{getattr(entity, 'first_name', None) or ''} {getattr(entity, 'last_name', None) or ''}".strip()
+    return name or getattr(entity, 'username', None) or f"User{entity.id}"
+
+def message_preview(message) -> str:
+    """Preview ngắn của tin nhắn cuối"""
+    if message is None:
+        return ""
+    text = message.message or ""
+    if not text and message.media is not None:
+        return "[media]"
+    return text[:PREVIEW_LENGTH]
+
+class DialogIndex:
+    """Index dialog trong bộ nhớ, sắp theo hoạt động gần nhất
+
+    Nạp một lần bằng iter_dialogs, sau đó cập nhật từ NewMessage /
+    MessageEdited / MessageRead. OrderedDict giữ thứ tự: cuối = mới nhất,
+    nên top N chỉ là duyệt ngược, không cần sort.
+    """
+
+    def __init__(self, capacity: int = 200):
+        self.capacity = capacity
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+        self._last_message_ids: Dict[int, int] = {}
+        # Sự kiện trong lúc đang nạp: chat có tin mới (theo thứ tự đến) và chat chỉ bị đọc/sửa
+        self._arrivals: "OrderedDict[int, None]" = OrderedDict()
+        self._touched: Set[int] = set()
+        self._reconcile_task: Optional[asyncio.Task] = None
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def top(self, limit: int) -> List[dict]:
+        """Top N dialog theo hoạt động gần nhất"""
+        result = []
+        for entry in reversed(self._entries.values()):
+            if len(result) >= limit:
+                break
+            result.append(dict(entry))
+        return result
+
+    def can_serve(self, limit: int) -> bool:
+        """Index đủ để trả lời /api/chats?limit=N hay không"""
+        return self.ready and limit <= self.capacity
+
+    def title(self, chat_id: int) -> Optional[str]:
+        entry = self._entries.get(chat_id)
+        return entry["title"] if entry else None
+
+    def chat_type(self, chat_id: int) -> Optional[str]:
+        entry = self._entries.get(chat_id)
+        return entry["type"] if entry else None
+
+    def last_message_id(self, chat_id: int) -> Optional[int]:
+        return self._last_message_ids.get(chat_id)
+
+    def export(self) -> dict:
+        """Trạng thái index dạng JSON được (cho warm-start snapshot)"""
+        return {
+            "entries": [dict(entry) for entry in self._entries.values()],
+            "last_message_ids": {str(k): v for k, v in self._last_message_ids.items()}
+        }
+
+    def restore(self, state: dict):
+        """Nạp index từ snapshot; lần đối chiếu đầu tiên với Telegram sẽ thay thế"""
+        if self.ready or not state.get("entries"):
+            return
+        entries = OrderedDict((int(entry["id"]), dict(entry)) for entry in state["entries"])
+        for entry in entries.values():
+            entry["unread_count"] = int(entry["unread_count"])
+            entry["title"] = str(entry["title"])
+        last_ids = {int(k): int(v) for k, v in state.get("last_message_ids", {}).items()}
+        # Chỉ gán khi đã kiểm tra xong, snapshot hỏng không để lại index dở dang
+        self._entries = entries
+        self._last_message_ids = last_ids
+        self._evict()
+        self.ready = True
+
+    async def load(self, client):
+        """Nạp (hoặc nạp lại) toàn bộ index từ Telegram"""
+        self._arrivals.clear()
+        self._touched.clear()
+        entries: "OrderedDict[int, dict]" = OrderedDict()
+        last_ids: Dict[int, int] = {}
+        dialogs = []
+        async for dialog in client.iter_dialogs(limit=self.capacity):
+            dialogs.append(dialog)
+
+        # iter_dialogs trả về mới nhất trước, index giữ mới nhất ở cuối
+        for dialog in reversed(dialogs):
+            entries[dialog.id] = self._entry_from_dialog(dialog)
+            if dialog.message is not None:
+                last_ids[dialog.id] = dialog.message.id
+
+        # Chat có tin mới trong lúc nạp: đưa lên đầu theo đúng thứ tự tin đến
+        for chat_id in self._arrivals:
+            if chat_id in self._entries:
+                entries.pop(chat_id, None)
+                entries[chat_id] = self._entries[chat_id]
+                if chat_id in self._last_message_ids:
+                    last_ids[chat_id] = self._last_message_ids[chat_id]
+        # Chat chỉ bị đọc/sửa: giữ vị trí theo Telegram, lấy trạng thái mới hơn
+        for chat_id in self._touched:
+            if chat_id in entries and chat_id in self._entries and chat_id not in self._arrivals:
+                entries[chat_id] = self._entries[chat_id]
+
+        # Chat có tin mới hơn lần nạp trước: lịch sử đã cache (kể cả từ warm snapshot) đã cũ
+        stale = [chat_id for chat_id, message_id in last_ids.items()
+                 if self._last_message_ids.get(chat_id) != message_id]
+        self._entries = entries
+        self._last_message_ids = last_ids
+        self._evict()
+        self.ready = True
+        invalidation.invalidate(TAG_CHATS, *(chat_tag(chat_id) for chat_id in stale))
+        logger.info(f"📇 Dialog index loaded: {len(self._entries)} dialogs")
+
+    async def start(self, client):
+        """Nạp index và chạy vòng đối chiếu định kỳ ở background"""
+        if self._reconcile_task is None:
+            self._reconcile_task = asyncio.create_task(self._reconcile_loop(client))
+
+    async def stop(self):
+        if self._reconcile_task:
+            self._reconcile_task.cancel()
+            try:
+                await self._reconcile_task
+            except asyncio.CancelledError:
+                pass
+            self._reconcile_task = None
+
+    async def _reconcile_loop(self, client):
+        while True:
+            try:
+                await self.load(client)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Dialog index reconcile failed: {e}")
+            await asyncio.sleep(telegram_settings.dialog_reconcile_interval)
+
+    async def record_message(self, event):
+        """Cập nhật index từ NewMessage (cả group/channel và tin gửi đi)
+
+        Chat mới được chèn ngay (không await) để các update đồng thời của cùng
+        chat dùng chung một entry; tên chat được điền sau nếu update không
+        kèm entity.
+        """
+        chat_id = event.chat_id
+        message = event.message
+        entry = self._entries.pop(chat_id, None)
+        is_new = entry is None
+        if is_new:
+            # event.chat chỉ đọc entity có sẵn trong update, không gọi mạng
+            entry = self._entry_from_chat(chat_id, event.chat)
+
+        entry["last_message_date"] = message.date.isoformat() if message.date else None
+        entry["last_message"] = message_preview(message)
+        if not message.out:
+            entry["unread_count"] += 1
+
+        self._entries[chat_id] = entry
+        self._last_message_ids[chat_id] = message.id
+        self._arrivals.pop(chat_id, None)
+        self._arrivals[chat_id] = None
+        self._evict()
+
+        if is_new and event.chat is None:
+            chat = await event.get_chat()
+            if chat is not None:
+                identity = self._entry_from_chat(chat_id, chat)
+                entry.update({key: value for key, value in identity.items() if key in IDENTITY_FIELDS})
+
+    def record_edit(self, event):
+        """Cập nhật preview nếu tin được sửa là tin cuối của dialog"""
+        chat_id = event.chat_id
+        entry = self._entries.get(chat_id)
+        if entry is not None and self._last_message_ids.get(chat_id) == event.message.id:
+            entry["last_message"] = message_preview(event.message)
+            self._touched.add(chat_id)
+
+    def record_read(self, event):
+        """Cập nhật unread count khi mình đọc tin trong một chat"""
+        entry = self._entries.get(event.chat_id)
+        if entry is None:
+            return
+        still_unread = getattr(event.original_update, 'still_unread_count', None)
+        if still_unread is not None:
+            entry["unread_count"] = still_unread
+        elif event.max_id >= self._last_message_ids.get(event.chat_id, 0):
+            entry["unread_count"] = 0
+        self._touched.add(event.chat_id)
+
+    def _evict(self):
+        while len(self._entries) > self.capacity:
+            chat_id, _ = self._entries.popitem(last=False)
+            self._last_message_ids.pop(chat_id, None)
+
+    @staticmethod
+    def _entry_from_dialog(dialog) -> dict:
+        entry = {
+            "id": dialog.id,
+            "title": dialog.title or dialog.name,
+            "type": "private" if dialog.is_user else ("group" if dialog.is_group else "channel"),
+            "unread_count": dialog.unread_count,
+            "last_message_date": dialog.date.isoformat() if dialog.date else None,
+            "last_message": message_preview(dialog.message)
+        }
+        # dialog.entity đã có sẵn thông tin user, không cần get_entity
+        if dialog.is_user:
+            entity = dialog.entity
+            entry.update({
+                "username": getattr(entity, 'username', None),
+                "first_name": getattr(entity, 'first_name', None),
+                "last_name": getattr(entity, 'last_name', None)
+            })
+        return entry
+
+    @staticmethod
+    def _entry_from_chat(chat_id: int, chat) -> dict:
+        is_user = chat is not None and hasattr(chat, 'first_name')
+        if is_user:
+            chat_type = "private"
+        elif getattr(chat, 'broadcast', False):
+            chat_type = "channel"
+        else:
+            chat_type = "group"
+        entry = {
+            "id": chat_id,
+            "title": display_name(chat),
+            "type": chat_type,
+            "unread_count": 0,
+            "last_message_date": None,
+            "last_message": ""
+        }
+        if is_user:
+            entry.update({
+                "username": getattr(chat, 'username', None),
+                "first_name": getattr(chat, 'first_name', None),
+                "last_name": getattr(chat, 'last_name', None)
+            })
+        return entry
+
+# Singleton instance
+dialog_index = DialogIndex(capacity=telegram_settings.dialog_index_size)
@@ -0,0 +1,139 @@
+# server/src/telegram/filters.py
+import json
+import logging
+import re
+import time
+from pathlib import Path
+from typing import Dict, FrozenSet, Optional, Tuple
+from telethon.tl.types import MessageEntityMentionName
+from core.config import settings
+from core.storage import write_atomic
+from .schemas import ChatRule, MonitorRules
+from .search import fold_text
+
+logger = logging.getLogger(__name__)
+
+class CompiledRule:
+    """Rule đã biên dịch: mọi từ khoá gộp thành một regex trên text đã fold"""
+
+    __slots__ = ("pattern", "mentions", "replies", "senders")
+
+    def __init__(self, rule: ChatRule):
+        keywords = sorted({fold_text(k).strip() for k in rule.keywords} - {""}, key=len, reverse=True)
+        self.pattern = re.compile(
+            r"(?<!\w)(?:" + "|".join(re.escape(k) for k in keywords) + r")(?!\w)"
+        ) if keywords else None
+        self.mentions = rule.mentions
+        self.replies = rule.replies
+        self.senders: FrozenSet[int] = frozenset(rule.senders)
+
+class MessageFilter:
+    """Bộ lọc tin group/channel, chạy trong `func` của event builder
+
+    Được gọi một lần cho mỗi update, trước khi resolve sender hay tạo
+    payload: tra rule theo chat_id (dict), so sender_id / cờ mentioned có
+    sẵn trong update, rồi tối đa một lần regex.search trên text đã bỏ dấu.
+    Tin không khớp bị bỏ ngay trong dispatcher của Telethon.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.rules = MonitorRules()
+        self._compiled: Dict[int, CompiledRule] = {}
+        self._default: Optional[CompiledRule] = None
+        # Tài khoản của mình (set_me lúc đăng ký handler), để tách @mention khỏi reply
+        self._me_id: Optional[int] = None
+        self._me_handle: Optional[str] = None
+        self.evaluated = 0
+        self.matched = 0
+        self.eval_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._compiled) or self._default is not None
+
+    @staticmethod
+    def build(rules: MonitorRules) -> Tuple[Dict[int, CompiledRule], Optional[CompiledRule]]:
+        """Biên dịch rule mà chưa áp dụng (raise nếu rule không hợp lệ)"""
+        compiled = {int(key): CompiledRule(rule) for key, rule in rules.rules.items() if key != "*"}
+        default = rules.rules.get("*")
+        return compiled, CompiledRule(default) if default else None
+
+    def apply(self, rules: MonitorRules, built: Tuple[Dict[int, CompiledRule], Optional[CompiledRule]]):
+        self._compiled, self._default = built
+        self.rules = rules
+        logger.info(f"🔎 Monitor rules compiled: {len(self._compiled)} chats"
+                    f"{' + default rule' if self._default else ''}")
+
+    def set_me(self, me):
+        """Ghi nhớ ID/username của tài khoản (kết quả client.get_me())"""
+        self._me_id = me.id
+        self._me_handle = f"@{me.username.lower()}" if me.username else None
+
+    def compile(self, rules: MonitorRules):
+        self.apply(rules, self.build(rules))
+
+    def load(self):
+        """Nạp rule từ file, hoặc từ biến MONITOR_RULES khi chưa có file"""
+        try:
+            if self.path.exists():
+                raw = json.loads(self.path.read_text(encoding="utf-8"))
+            elif settings.monitor_rules:
+                raw = json.loads(settings.monitor_rules)
+            else:
+                return
+            self.compile(MonitorRules(**raw))
+        except Exception as e:
+            logger.error(f"❌ Invalid monitor rules, group monitoring disabled: {e}")
+
+    def save(self, rules: MonitorRules):
+        data = json.dumps(rules.dict(), ensure_ascii=False, indent=2).encode("utf-8")
+        write_atomic(self.path, data)
+
+    def match(self, event) -> Optional[str]:
+        """Lý do chuyển tiếp tin group/channel ("sender", "mention", "reply", "keyword:<từ>") hoặc None"""
+        rule = self._compiled.get(event.chat_id, self._default)
+        if rule is None:
+            return None
+        started = time.perf_counter()
+        self.evaluated += 1
+        reason = self._evaluate(rule, event.message)
+        if reason is not None:
+            self.matched += 1
+        self.eval_seconds += time.perf_counter() - started
+        return reason
+
+    def _evaluate(self, rule: CompiledRule, message) -> Optional[str]:
+        if rule.senders and message.sender_id in rule.senders:
+            return "sender"
+        # Telegram đặt `mentioned` cho cả @mention lẫn reply vào tin của mình
+        if message.mentioned and (rule.mentions or rule.replies):
+            if message.reply_to is None or self._mentions_me(message):
+                if rule.mentions:
+                    return "mention"
+            elif rule.replies:
+                return "reply"
+        if rule.pattern is not None and message.message:
+            found = rule.pattern.search(fold_text(message.message))
+            if found:
+                return f"keyword:{found.group(0)}"
+        return None
+
+    def _mentions_me(self, message) -> bool:
+        """Nhắc tên trực tiếp (không chỉ là reply)"""
+        for entity in message.entities or ():
+            if isinstance(entity, MessageEntityMentionName) and entity.user_id == self._me_id:
+                return True
+        return self._me_handle is not None and self._me_handle in (message.message or "").lower()
+
+    def stats(self) -> dict:
+        return {
+            "chats": len(self._compiled),
+            "default_rule": self._default is not None,
+            "evaluated": self.evaluated,
+            "matched": self.matched,
+            "avg_eval_us": round(self.eval_seconds / self.evaluated * 1e6, 2) if self.evaluated else 0.0
+        }
+
+# Singleton instance
+message_filter = MessageFilter(settings.monitor_rules_path)
@@ -1,110 +1,259 @@
 # server/src/telegram/handlers.py
 import logging
+import weakref
 from telethon import events
 from telethon.tl.types import PeerUser
 from api.websocket import websocket_manager
 from .schemas import TelegramMessage
+from .dialogs import dialog_index, display_name as entity_name
+from .filters import message_filter
+from .transcription import is_voice_message, transcription_service
+from .search import search_index
+from .pipeline import handler_pipeline
+from .routing import edit_debouncer, message_router
+from .snapshot import warm_snapshot
+from .trace import trace_recorder
+from core.config import settings
+from core.invalidation import invalidation, chat_tag, TAG_CHATS, TAG_MESSAGES
 
 logger = logging.getLogger(__name__)
 
+# Lý do khớp rule theo dõi của từng event, ghi ở filter và đọc lại trong handler.
+# Telethon dùng chung một object event cho mọi handler cùng loại builder nên
+# giữ bên ngoài event (weak key: tự mất khi event được giải phóng).
+_match_reasons: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+def is_private(event) -> bool:
+    """Filter ở event builder: chỉ chat riêng (không phải group/channel)"""
+    return event.is_private
+
+def should_forward(event) -> bool:
+    """Filter ở event builder: chat riêng, hoặc tin group/channel khớp rule theo dõi
+    
+    Chạy trước khi resolve sender; lý do khớp được lưu lại (match_reason)
+    để handler không phải đánh giá lại.
+    """
+    if event.is_private:
+        return True
+    if not message_filter.enabled:
+        return False
+    reason = message_filter.match(event)
+    if reason is None:
+        return False
+    _match_reasons[event] = reason
+    return True
+
+def match_reason(event):
+    """Lý do tin group/channel khớp rule (None với chat riêng)"""
+    return _match_reasons.get(event)
+
+def chat_title(event):
+    """Tên group/channel từ dialog index hoặc entity có sẵn trong update (không gọi mạng)"""
+    if event.is_private:
+        return None
+    return dialog_index.title(event.chat_id) or (entity_name(event.chat) if event.chat else None)
+
 async def register_handlers(client):
-    """Đăng ký các event handlers cho Telegram client"""
+    """Đăng ký các event handlers cho Telegram client
     
-    @client.on(events.NewMessage)
-    async def handle_new_message(event):
+    Lọc incoming/private (và rule theo dõi group/channel) được đẩy xuống
+    event builder của Telethon, event còn lại đi qua handler_pipeline
+    (worker pool có giới hạn, thứ tự theo chat).
+    """
+    handler_pipeline.start()
+    message_filter.load()
+    # Rule có thể được bật sau qua API nên luôn lấy, kể cả khi chưa có rule
+    try:
+        message_filter.set_me(await client.get_me())
+    except Exception as e:
+        logger.warning(f"⚠️ get_me failed, mentions in replies count as replies: {e}")
+    
+    tracing = trace_recorder is not None
+    if tracing:
+        try:
+            await trace_recorder.start()
+        except Exception as e:
+            # Trace chỉ để benchmark: lỗi thì tắt trace, không bỏ đăng ký handler
+            logger.error(f"❌ Trace recorder failed to start, tracing disabled: {e}")
+            tracing = False
+    
+    if tracing:
+        # Đăng ký trước mọi handler khác để timestamp là lúc update đến
+        @client.on(events.NewMessage)
+        async def trace_new_message(event):
+            trace_recorder.record_message(event)
+        
+        @client.on(events.MessageEdited)
+        async def trace_message_edited(event):
+            trace_recorder.record_message(event, edited=True)
+        
+        @client.on(events.MessageDeleted)
+        async def trace_message_deleted(event):
+            trace_recorder.record_deleted(event)
+    
+    async def process_new_message(event):
         """Xử lý tin nhắn mới từ Telegram"""
         try:
-            # Chỉ xử lý tin nhắn riêng tư (không phải group/channel)
-            if not event.is_private:
-                return
-                
-            # Bỏ qua tin nhắn từ chính mình
-            if event.out:
-                return
-                
             # Lấy thông tin người gửi
             sender = await event.get_sender()
             if not sender:
                 logger.warning("Không thể lấy thông tin sender")
                 return
                 
-            # Tạo tên hiển thị
-            sender_name = []
-            if sender.first_name:
-                sender_name.append(sender.first_name)
-            if sender.last_name:
-                sender_name.append(sender.last_name)
-                
-            display_name = " ".join(sender_name) if sender_name else (
-                sender.username or f"User{sender.id}"
-            )
+            # Tạo tên hiển thị (user, hoặc channel với tin đăng ẩn danh)
+            display_name = entity_name(sender)
             
             # Tạo message object
             message_data = TelegramMessage(
-                chat_id=event.peer_id.user_id,
+                chat_id=event.chat_id,
                 sender=display_name,
                 text=event.message.message or "",
                 message_id=event.message.id,
-                date=event.message.date
+                date=event.message.date,
+                chat_title=chat_title(event),
+                matched=match_reason(event)
             )
             
             logger.info(f"📨 New message from {display_name}: {message_data.text[:50]}...")
             
+            if settings.search_enabled:
+                search_index.add(message_data.chat_id, event.message, display_name)
+            
             # Broadcast qua WebSocket
             await websocket_manager.broadcast_message(message_data.dict())
             
+            # Voice/audio: transcribe ở background, gửi tiếp `message_transcribed`
+            if transcription_service and is_voice_message(event.message):
+                transcription_service.submit(client, message_data.chat_id, display_name, event.message)
+            
         except Exception as e:
             logger.error(f"Error handling new message: {e}", exc_info=True)
     
-    @client.on(events.MessageEdited)
-    async def handle_message_edited(event):
+    async def process_message_edited(event):
         """Xử lý tin nhắn được chỉnh sửa"""
         try:
-            if not event.is_private or event.out:
-                return
-                
             sender = await event.get_sender()
-            display_name = f"{sender.first_name or ''} {sender.last_name or ''}".strip() or sender.username or f"User{sender.id}"
+            display_name = entity_name(sender)
             
             message_data = {
                 "type": "message_edited",
-                "chat_id": event.peer_id.user_id,
+                "chat_id": event.chat_id,
                 "sender": display_name,
                 "text": event.message.message or "",
                 "message_id": event.message.id,
-                "edited": True
+                "edited": True,
+                "chat_title": chat_title(event),
+                "matched": match_reason(event)
             }
             
+            if settings.search_enabled:
+                search_index.add(event.chat_id, event.message, display_name)
+            
             logger.info(f"✏️ Message edited from {display_name}")
             await websocket_manager.broadcast_message(message_data)
             
         except Exception as e:
             logger.error(f"Error handling edited message: {e}")
     
-    @client.on(events.MessageDeleted)
-    async def handle_message_deleted(event):
-        """Xử lý tin nhắn bị xóa"""
+    async def process_message_deleted(deletion):
+        """Xử lý tin nhắn bị xóa: deletion là (chat_id, message_ids) đã định tuyến"""
+        chat_id, message_ids = deletion
         try:
-            message_data = {
-                "type": "message_deleted",
-                "message_ids": event.deleted_ids
-            }
+            if settings.search_enabled:
+                search_index.remove(chat_id, message_ids)
             
-            logger.info(f"🗑️ Messages deleted: {event.deleted_ids}")
-            await websocket_manager.broadcast_message(message_data)
+            logger.info(f"🗑️ Messages deleted: {message_ids}")
+            
+            warm_snapshot.invalidate(chat_id)
+            # Không rõ chat: bỏ lịch sử mọi chat trong response cache
+            invalidation.invalidate(chat_tag(chat_id) if chat_id is not None else TAG_MESSAGES, TAG_CHATS)
+            await websocket_manager.broadcast_message({
+                "type": "message_deleted",
+                "chat_id": chat_id,
+                "message_ids": message_ids
+            })
             
         except Exception as e:
             logger.error(f"Error handling deleted message: {e}")
     
-    @client.on(events.UserUpdate)
-    async def handle_user_update(event):
-        """Xử lý cập nhật trạng thái user (online/offline)"""
+    @client.on(events.NewMessage(incoming=True, func=should_forward))
+    async def handle_new_message(event):
+        """Tin nhắn riêng / tin group-channel khớp rule -> pipeline"""
+        await handler_pipeline.submit(event.chat_id, process_new_message, event)
+    
+    async def submit_edit(event):
+        await handler_pipeline.submit(event.chat_id, process_message_edited, event)
+    
+    @client.on(events.MessageEdited(incoming=True, func=should_forward))
+    async def handle_message_edited(event):
+        """Tin nhắn riêng / group-channel khớp rule được sửa -> debounce -> pipeline"""
+        edit_debouncer.submit((event.chat_id, event.message.id), event, submit_edit)
+    
+    @client.on(events.MessageDeleted)
+    async def handle_message_deleted(event):
+        """Tin nhắn bị xoá -> bỏ edit đang debounce -> pipeline
+        
+        Định tuyến theo chat ngay tại đây để việc xoá vào cùng worker với
+        các edit của chat đó, không thể bị edit đến trước vượt mặt.
+        ID không rõ chat gửi với chat_id None như trước.
+        """
+        for chat_id, message_ids in message_router.resolve(event.deleted_ids, event.chat_id).items():
+            edit_debouncer.discard(chat_id, message_ids)
+            await handler_pipeline.submit(chat_id, process_message_deleted, (chat_id, message_ids))
+    
+    if settings.search_enabled:
+        @client.on(events.NewMessage(outgoing=True, func=is_private))
+        async def index_outgoing_message(event):
+            """Tin mình gửi chỉ cần đưa vào search index"""
+            search_index.add(event.chat_id, event.message, "Me")
+    
+    @client.on(events.NewMessage)
+    async def track_dialog_activity(event):
+        """Cập nhật dialog index và message router (mọi chat, cả tin gửi đi)"""
         try:
-            # Chỉ log, không broadcast để tránh spam
-            if hasattr(event, 'user_id'):
-                logger.debug(f"👤 User {event.user_id} status updated")
-                
+            if not event.is_channel:
+                message_router.record(event.chat_id, event.message.id)
+            warm_snapshot.invalidate(event.chat_id)
+            await dialog_index.record_message(event)
         except Exception as e:
-            logger.error(f"Error handling user update: {e}")
+            logger.error(f"Error updating dialog index: {e}")
+        finally:
+            # Sau khi index đã cập nhật, để request tiếp theo không cache lại bản cũ
+            invalidation.invalidate(chat_tag(event.chat_id), TAG_CHATS)
+    
+    @client.on(events.MessageEdited)
+    async def track_dialog_edit(event):
+        """Cập nhật preview trong dialog index khi tin cuối bị sửa"""
+        try:
+            warm_snapshot.invalidate(event.chat_id)
+            # Danh sách chat chỉ đổi khi tin bị sửa là tin cuối (preview)
+            if dialog_index.last_message_id(event.chat_id) == event.message.id:
+                invalidation.invalidate(chat_tag(event.chat_id), TAG_CHATS)
+            else:
+                invalidation.invalidate(chat_tag(event.chat_id))
+            dialog_index.record_edit(event)
+        except Exception as e:
+            logger.error(f"Error updating dialog index: {e}")
+    
+    @client.on(events.MessageRead(inbox=True))
+    async def track_dialog_read(event):
+        """Cập nhật unread count khi tin nhắn được đọc"""
+        try:
+            invalidation.invalidate(TAG_CHATS)
+            dialog_index.record_read(event)
+        except Exception as e:
+            logger.error(f"Error updating dialog index: {e}")
+    
+    if settings.handle_user_updates:
+        @client.on(events.UserUpdate)
+        async def handle_user_update(event):
+            """Xử lý cập nhật trạng thái user (online/offline)"""
+            try:
+                # Chỉ log, không broadcast để tránh spam
+                if hasattr(event, 'user_id'):
+                    logger.debug(f"👤 User {event.user_id} status updated")
+                    
+            except Exception as e:
+                logger.error(f"Error handling user update: {e}")
     
     logger.info("✅ All event handlers registered successfully")
\ No newline at end of file
@@ -0,0 +1,352 @@
+# server/src/telegram/media.py
+import asyncio
+import itertools
+import logging
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Tuple
+import aiofiles
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Seek xa hơn mức này so với phần đã tải thì tải trực tiếp đoạn đó từ Telegram
+DIRECT_RANGE_THRESHOLD = 1024 * 1024
+MEDIA_REF_CACHE_SIZE = 512
+# File không rõ size (có thể không vừa cache): huỷ lượt tải sau chừng này giây không còn reader
+IDLE_CANCEL_DELAY = 30.0
+_download_ids = itertools.count(1)
+
+class MediaRef:
+    """Mô tả file media của một message (đủ để tải, không cần get_messages lại)"""
+
+    __slots__ = ("key", "media", "size", "mime_type")
+
+    def __init__(self, key: str, media, size: Optional[int], mime_type: str):
+        self.key = key
+        self.media = media
+        self.size = size
+        self.mime_type = mime_type
+
+    @classmethod
+    def from_message(cls, message) -> Optional["MediaRef"]:
+        if message is None or message.media is None:
+            return None
+        if message.document is not None:
+            return cls(
+                f"doc_{message.document.id}",
+                message.document,
+                message.document.size,
+                message.document.mime_type or "application/octet-stream"
+            )
+        if message.photo is not None:
+            return cls(
+                f"photo_{message.photo.id}",
+                message.photo,
+                message.file.size if message.file else None,
+                "image/jpeg"
+            )
+        return None
+
+class MediaDownload:
+    """Một lượt tải đang chạy, nhiều request cùng đọc file .part khi nó lớn dần
+
+    Lượt tải chạy tới hết để file vào cache kể cả khi không còn reader
+    (request Range ngắn như `bytes=0-1` kết thúc ngay). Chỉ file không rõ
+    size mới bị huỷ, sau IDLE_CANCEL_DELAY giây không có reader nào.
+    """
+
+    def __init__(self, ref: MediaRef, part_path: Path):
+        self.ref = ref
+        self.part_path = part_path
+        self.written = 0
+        self.done = False
+        self.error: Optional[Exception] = None
+        self.readers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.idle_timer: Optional[asyncio.TimerHandle] = None
+        self._progress = asyncio.Condition()
+
+    async def wait_for(self, offset: int) -> int:
+        """Chờ tới khi có dữ liệu ở sau offset, trả về số byte đã ghi"""
+        async with self._progress:
+            await self._progress.wait_for(lambda: self.written > offset or self.done)
+        if self.error is not None and self.written <= offset:
+            raise self.error
+        return self.written
+
+    async def _advance(self, written: int = 0, done: bool = False, error: Exception = None):
+        async with self._progress:
+            self.written += written
+            self.done = self.done or done
+            self.error = error or self.error
+            self._progress.notify_all()
+
+class MediaCache:
+    """Cache media trên đĩa theo Telegram file ID, giới hạn dung lượng, LRU eviction
+
+    Các request đồng thời cho cùng một file dùng chung một lượt tải.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, chunk_size: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._downloads: Dict[str, MediaDownload] = {}
+        self._refs: "OrderedDict[Tuple[int, int], MediaRef]" = OrderedDict()
+        self._loaded = False
+
+    def _ensure_loaded(self):
+        """Quét thư mục cache lần đầu dùng, sắp LRU theo thời gian truy cập"""
+        if self._loaded:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        files = []
+        for path in self.cache_dir.iterdir():
+            if path.suffix == ".part":
+                path.unlink(missing_ok=True)  # lượt tải dang dở từ lần chạy trước
+                continue
+            stat = path.stat()
+            files.append((stat.st_atime, path.name, stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._loaded = True
+        self._evict()
+        logger.info(f"🗂️ Media cache: {len(self._entries)} files, {self._total_bytes // 1024} KB")
+
+    async def resolve(self, client, chat_id: int, message_id: int) -> Optional[MediaRef]:
+        """Lấy MediaRef của message (có cache nhỏ để các request Range liên tiếp không gọi lại API)"""
+        ref_key = (chat_id, message_id)
+        ref = self._refs.get(ref_key)
+        if ref is not None:
+            self._refs.move_to_end(ref_key)
+            return ref
+        message = await client.get_messages(chat_id, ids=message_id)
+        ref = MediaRef.from_message(message)
+        if ref is not None:
+            self._refs[ref_key] = ref
+            if len(self._refs) > MEDIA_REF_CACHE_SIZE:
+                self._refs.popitem(last=False)
+        return ref
+
+    def cached_path(self, key: str) -> Optional[Path]:
+        """Đường dẫn file đã cache (đánh dấu vừa dùng), None nếu chưa có"""
+        self._ensure_loaded()
+        if key not in self._entries:
+            return None
+        path = self.cache_dir / key
+        if not path.exists():
+            self._total_bytes -= self._entries.pop(key)
+            return None
+        self._entries.move_to_end(key)
+        return path
+
+    def fits(self, ref: MediaRef) -> bool:
+        """File có thể nằm trong cache không (không biết size thì coi như có)"""
+        return ref.size is None or ref.size <= self.max_bytes
+
+    def get_download(self, client, ref: MediaRef) -> MediaDownload:
+        """Lượt tải đang chạy cho file này, hoặc bắt đầu lượt mới (đã tính một reader)"""
+        self._ensure_loaded()
+        download = self._downloads.get(ref.key)
+        if download is None:
+            # Tên .part riêng cho mỗi lượt: lượt bị huỷ còn đang dọn file không đụng lượt mới
+            part_path = self.cache_dir / f"{ref.key}.{next(_download_ids)}.part"
+            part_path.touch()
+            download = MediaDownload(ref, part_path)
+            self._downloads[ref.key] = download
+            download.task = asyncio.create_task(self._run_download(client, download))
+        download.readers += 1
+        if download.idle_timer is not None:
+            download.idle_timer.cancel()
+            download.idle_timer = None
+        return download
+
+    def release(self, download: MediaDownload):
+        """Reader rời đi; lượt tải file không rõ size bị huỷ nếu không ai quay lại"""
+        download.readers -= 1
+        if download.readers <= 0 and not download.done and download.ref.size is None:
+            download.idle_timer = asyncio.get_running_loop().call_later(
+                IDLE_CANCEL_DELAY, self._cancel_idle, download
+            )
+
+    def _cancel_idle(self, download: MediaDownload):
+        download.idle_timer = None
+        if download.readers > 0 or download.done:
+            return
+        if self._downloads.get(download.ref.key) is download:
+            del self._downloads[download.ref.key]
+        download.task.cancel()
+
+    async def fetch(self, client, ref: MediaRef) -> Path:
+        """Đảm bảo file đã nằm trong cache (dùng chung lượt tải nếu có) và trả về đường dẫn"""
+        path = self.cached_path(ref.key)
+        if path is not None:
+            return path
+        if not self.fits(ref):
+            raise RuntimeError(f"Media {ref.key} is larger than the media cache")
+        download = self.get_download(client, ref)
+        try:
+            async with download._progress:
+                await download._progress.wait_for(lambda: download.done)
+        finally:
+            self.release(download)
+        if download.error is not None:
+            raise download.error
+        path = self.cached_path(ref.key)
+        if path is None:
+            raise RuntimeError(f"Media {ref.key} is larger than the media cache")
+        return path
+
+    async def _run_download(self, client, download: MediaDownload):
+        ref = download.ref
+        try:
+            async with aiofiles.open(download.part_path, "wb") as f:
+                async for chunk in client.iter_download(
+                    ref.media, chunk_size=self.chunk_size, request_size=self.chunk_size, file_size=ref.size
+                ):
+                    await f.write(chunk)
+                    await f.flush()
+                    await download._advance(len(chunk))
+
+            final_path = self.cache_dir / ref.key
+            if download.written > self.max_bytes:
+                # Lớn hơn cả cache: reader đang mở file vẫn đọc được sau unlink
+                download.part_path.unlink(missing_ok=True)
+            else:
+                os.replace(download.part_path, final_path)
+                self._entries[ref.key] = download.written
+                self._total_bytes += download.written
+                self._evict()
+            logger.info(f"📥 Media {ref.key} downloaded ({download.written // 1024} KB)")
+            await download._advance(done=True)
+
+        except asyncio.CancelledError:
+            logger.info(f"📥 Media {ref.key} download cancelled at {download.written // 1024} KB (no readers left or shutting down)")
+            download.part_path.unlink(missing_ok=True)
+            await download._advance(done=True, error=RuntimeError(f"Media {ref.key} download cancelled"))
+            raise
+        except Exception as e:
+            logger.error(f"❌ Media download {ref.key} failed: {e}")
+            download.part_path.unlink(missing_ok=True)
+            await download._advance(done=True, error=e)
+        finally:
+            if self._downloads.get(ref.key) is download:
+                del self._downloads[ref.key]
+
+    async def stop(self):
+        """Huỷ các lượt tải còn chạy khi tắt server (file .part được dọn)"""
+        downloads = list(self._downloads.values())
+        for download in downloads:
+            if download.idle_timer is not None:
+                download.idle_timer.cancel()
+            download.task.cancel()
+        for download in downloads:
+            try:
+                await download.task
+            except asyncio.CancelledError:
+                pass
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            (self.cache_dir / key).unlink(missing_ok=True)
+            logger.debug(f"🧹 Evicted media {key}")
+
+    async def stream_file(self, path: Path, start: int, end: int) -> AsyncIterator[bytes]:
+        """Stream đoạn [start, end] của file đã cache"""
+        async with aiofiles.open(path, "rb") as f:
+            await f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    async def stream_download(self, download: MediaDownload, start: int, end: Optional[int]) -> AsyncIterator[bytes]:
+        """Stream từ file .part trong khi nó đang được tải
+
+        StreamingResponse huỷ generator khi client ngắt kết nối; finally trả
+        reader lại (lượt tải vẫn tiếp tục để file vào cache).
+        """
+        try:
+            async with aiofiles.open(download.part_path, "rb") as f:
+                await f.seek(start)
+                position = start
+                while end is None or position <= end:
+                    available = await download.wait_for(position)
+                    if available <= position:
+                        break  # tải xong, hết dữ liệu
+                    limit = available - position if end is None else min(available, end + 1) - position
+                    chunk = await f.read(min(self.chunk_size, limit))
+                    if not chunk:
+                        continue
+                    position += len(chunk)
+                    yield chunk
+        finally:
+            self.release(download)
+
+    async def stream_direct(self, client, ref: MediaRef, start: int, end: int) -> AsyncIterator[bytes]:
+        """Tải thẳng một đoạn từ Telegram (seek xa phía trước lượt tải chung)"""
+        remaining = end - start + 1
+        async for chunk in client.iter_download(
+            ref.media, offset=start, chunk_size=self.chunk_size, request_size=self.chunk_size, file_size=ref.size
+        ):
+            chunk = bytes(chunk[:remaining])
+            remaining -= len(chunk)
+            yield chunk
+            if remaining <= 0:
+                break
+
+    async def open_stream(self, client, ref: MediaRef, start: int, end: Optional[int]) -> AsyncIterator[bytes]:
+        """Chọn nguồn phù hợp: file cache, lượt tải chung, hoặc tải trực tiếp"""
+        path = self.cached_path(ref.key)
+        if path is not None:
+            return self.stream_file(path, start, end if end is not None else path.stat().st_size - 1)
+
+        # Lớn hơn cả cache: không ghi ra đĩa, chỉ tải phần client đang đọc
+        if not self.fits(ref):
+            return self.stream_direct(client, ref, start, end if end is not None else ref.size - 1)
+
+        download = self._downloads.get(ref.key)
+        written = download.written if download is not None else 0
+        if end is not None and start > written + DIRECT_RANGE_THRESHOLD:
+            return self.stream_direct(client, ref, start, end)
+        return self.stream_download(self.get_download(client, ref), start, end)
+
+def parse_range(header: Optional[str], size: Optional[int]) -> Optional[Tuple[int, int]]:
+    """Parse header Range (một đoạn), trả về (start, end) hoặc None nếu không dùng Range
+
+    Raise ValueError nếu Range không hợp lệ / không thoả mãn được.
+    """
+    if not header or size is None:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise ValueError("Unsupported range")
+    first, _, last = spec.strip().partition("-")
+    if first:
+        start = int(first)
+        end = int(last) if last else size - 1
+    else:
+        start = size - int(last)  # bytes=-N: N byte cuối
+        end = size - 1
+    start = max(start, 0)
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+# Singleton instance
+media_cache = MediaCache(
+    settings.media_cache_dir,
+    settings.media_cache_max_mb * 1024 * 1024,
+    settings.media_chunk_size
+)
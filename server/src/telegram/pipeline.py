@@ -0,0 +1,113 @@
+# server/src/telegram/pipeline.py
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SATURATION_LOG_INTERVAL = 10.0
+DRAIN_TIMEOUT = 5.0
+
+Handler = Callable[[object], Awaitable[None]]
+
+class HandlerPipeline:
+    """Worker pool có giới hạn cho event handlers, giữ thứ tự trong từng chat
+
+    Mỗi chat được băm cố định vào một worker (queue riêng), nên các event
+    của cùng một chat chạy tuần tự còn các chat khác nhau chạy song song.
+    Queue đầy thì submit chờ (backpressure) và ghi nhận saturation.
+
+    Backpressure và thứ tự chỉ đúng khi các submit được gọi tuần tự: client
+    tạo với sequential_updates=True nên vòng update của Telethon chờ ở đây.
+    Update chưa dispatch nằm trong queue nội bộ của Telethon (mỗi update một
+    object nhỏ, không phải một task đang treo).
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self.processed = 0
+        self.failed = 0
+        self.saturated = 0
+        self.max_depth = 0
+        self._last_saturation_log = 0.0
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+        self._tasks = [
+            asyncio.create_task(self._worker(queue), name=f"handler-worker-{i}")
+            for i, queue in enumerate(self._queues)
+        ]
+        logger.info(f"⚙️ Handler pipeline started: {self.workers} workers, queue {self.queue_size}")
+
+    async def stop(self):
+        """Xử lý nốt event còn trong queue (tối đa DRAIN_TIMEOUT giây) rồi dừng worker"""
+        if self._queues:
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(queue.join() for queue in self._queues)), DRAIN_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Handler pipeline stopped with {self.depth} events still queued")
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._queues = []
+
+    async def submit(self, chat_id: Optional[int], handler: Handler, event):
+        """Đưa event vào queue của worker phụ trách chat này"""
+        if not self._queues:
+            # Pipeline chưa chạy: xử lý trực tiếp
+            await handler(event)
+            return
+        queue = self._queues[hash(chat_id or 0) % self.workers]
+        if queue.full():
+            self.saturated += 1
+            now = time.monotonic()
+            if now - self._last_saturation_log > SATURATION_LOG_INTERVAL:
+                self._last_saturation_log = now
+                logger.warning(f"⚠️ Handler queue saturated (depth {queue.qsize()}, "
+                               f"{self.saturated} saturation events so far)")
+        await queue.put((handler, event))
+        self.max_depth = max(self.max_depth, queue.qsize())
+
+    @property
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "saturated": self.saturated,
+            "processed": self.processed,
+            "failed": self.failed
+        }
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            handler, event = await queue.get()
+            try:
+                await handler(event)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error in handler {getattr(handler, '__name__', handler)}: {e}", exc_info=True)
+            finally:
+                queue.task_done()
+
+# Singleton instance
+handler_pipeline = HandlerPipeline(settings.handler_workers, settings.handler_queue_size)
@@ -0,0 +1,112 @@
+# server/src/telegram/routing.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Channel/supergroup (-100xxxxxxxxxx) có dãy ID tin riêng, không đưa vào index
+CHANNEL_ID_BASE = -1000000000000
+
+class MessageRouter:
+    """Index có giới hạn message_id -> chat_id
+
+    Telethon không trả chat_id cho MessageDeleted ở chat riêng/group thường.
+    ID tin nhắn ngoài channel là duy nhất trong tài khoản, nên giữ map từ
+    tin mới/tin đã gửi là đủ để định tuyến sự kiện xoá.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._chats: "OrderedDict[int, int]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._chats)
+
+    def record(self, chat_id: Optional[int], message_id: Optional[int]):
+        if chat_id is None or message_id is None or chat_id <= CHANNEL_ID_BASE:
+            return
+        self._chats[message_id] = chat_id
+        self._chats.move_to_end(message_id)
+        while len(self._chats) > self.capacity:
+            self._chats.popitem(last=False)
+
+    def resolve(self, message_ids: Iterable[int], chat_id: Optional[int] = None) -> Dict[Optional[int], List[int]]:
+        """Nhóm các ID theo chat; ID không biết chat nằm dưới key None. Xoá khỏi index.
+
+        Có chat_id (xoá trong channel): ID thuộc dãy riêng của channel, không
+        đụng tới index của chat riêng/group thường.
+        """
+        if chat_id is not None:
+            return {chat_id: list(message_ids)}
+        grouped: Dict[Optional[int], List[int]] = {}
+        for message_id in message_ids:
+            owner = self._chats.pop(message_id, None)
+            grouped.setdefault(owner, []).append(message_id)
+        return grouped
+
+class EditDebouncer:
+    """Gộp chuỗi edit liên tiếp của cùng một tin thành bản mới nhất
+
+    Edit đầu tiên mở một cửa sổ `window` giây; các edit tiếp theo chỉ thay
+    event đang chờ. Cửa sổ được gia hạn nhưng không quá `max_wait` kể từ
+    edit đầu tiên, để live location vẫn cập nhật đều.
+    """
+
+    def __init__(self, window: float, max_wait: float):
+        self.window = window
+        self.max_wait = max_wait
+        self._pending: Dict[Tuple[int, int], list] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.collapsed = 0
+
+    def _spawn(self, emit: Callable[[object], Awaitable[None]], event):
+        # Giữ reference tới task để không bị garbage-collect giữa chừng
+        task = asyncio.create_task(emit(event))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def submit(self, key: Tuple[int, int], event, emit: Callable[[object], Awaitable[None]]):
+        if self.window <= 0:
+            self._spawn(emit, event)
+            return
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        entry = self._pending.get(key)
+        if entry is None:
+            handle = loop.call_later(self.window, self._fire, key)
+            self._pending[key] = [event, now, handle, emit]
+            return
+        self.collapsed += 1
+        entry[0] = event
+        entry[3] = emit
+        entry[2].cancel()
+        delay = min(self.window, max(0.0, entry[1] + self.max_wait - now))
+        entry[2] = loop.call_later(delay, self._fire, key)
+
+    def _fire(self, key: Tuple[int, int]):
+        entry = self._pending.pop(key, None)
+        if entry is not None:
+            event, _, _, emit = entry
+            self._spawn(emit, event)
+
+    def discard(self, chat_id: Optional[int], message_ids: Iterable[int]):
+        """Bỏ edit đang chờ của các tin đã bị xoá (chat_id None: khớp theo ID tin)"""
+        ids = set(message_ids)
+        for key in [k for k in self._pending if k[1] in ids and (chat_id is None or k[0] == chat_id)]:
+            self._pending.pop(key)[2].cancel()
+
+    async def flush(self):
+        """Phát ngay mọi edit đang chờ và chờ chúng vào pipeline (khi shutdown)"""
+        for key in list(self._pending):
+            self._pending[key][2].cancel()
+            self._fire(key)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+# Singleton instances
+message_router = MessageRouter(settings.message_router_size)
+edit_debouncer = EditDebouncer(settings.edit_debounce_ms / 1000, settings.edit_debounce_max_ms / 1000)
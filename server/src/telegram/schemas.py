@@ -1,6 +1,6 @@
 # server/src/telegram/schemas.py
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field, validator
 
 class TelegramMessage(BaseModel):
@@ -11,6 +11,8 @@ class TelegramMessage(BaseModel):
     message_id: Optional[int] = Field(None, description="ID của message")
     date: Optional[datetime] = Field(None, description="Thời gian gửi")
     type: str = Field(default="message", description="Loại message")
+    chat_title: Optional[str] = Field(None, description="Tên group/channel (None với chat riêng)")
+    matched: Optional[str] = Field(None, description="Lý do tin group/channel được chuyển tiếp")
     
     @validator('text')
     def validate_text(cls, v):
@@ -81,6 +83,27 @@ class ChatInfo(BaseModel):
     username: Optional[str] = Field(None, description="Username của chat")
     member_count: Optional[int] = Field(None, description="Số thành viên")
 
+class ChatRule(BaseModel):
+    """Rule theo dõi một group/channel: tin khớp bất kỳ điều kiện nào được chuyển tiếp"""
+    keywords: List[str] = Field(default_factory=list, description="Từ khoá (không phân biệt hoa thường / dấu)")
+    mentions: bool = Field(True, description="Tin nhắc tới mình (@username hoặc mention)")
+    replies: bool = Field(True, description="Tin trả lời tin của mình")
+    senders: List[int] = Field(default_factory=list, description="Luôn chuyển tiếp tin từ các sender ID này")
+
+class MonitorRules(BaseModel):
+    """Rule theo dõi group/channel, key là chat ID hoặc "*" (mọi group/channel khác)"""
+    rules: Dict[str, ChatRule] = Field(default_factory=dict, description="chat ID -> rule")
+    
+    @validator('rules')
+    def validate_chat_ids(cls, v):
+        for key in v:
+            if key != "*":
+                try:
+                    int(key)
+                except ValueError:
+                    raise ValueError(f"Rule key must be a chat ID or '*': {key}")
+        return v
+
 class ErrorResponse(BaseModel):
     """Model cho error response"""
     error: bool = Field(default=True)
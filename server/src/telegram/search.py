@@ -0,0 +1,369 @@
+# server/src/telegram/search.py
+import asyncio
+import logging
+import re
+import sqlite3
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 1.0
+FLUSH_BATCH_SIZE = 500
+# Buffer tối đa khi luồng ghi chậm/hỏng; vượt quá thì bỏ tin mới (đếm vào `dropped`)
+MAX_PENDING = FLUSH_BATCH_SIZE * 20
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Ngưỡng ID channel/supergroup (-100xxxxxxxxxx); chat riêng và group thường ở trên
+CHANNEL_ID_BOUND = -1000000000000
+# Số ký tự tối đa được cache trong bảng fold; ngoài ra tính lại mỗi lần
+FOLD_TABLE_LIMIT = 4096
+# Latin-1, Latin Extended-A/B, dấu kết hợp, Latin Extended Additional (tiếng Việt)
+_FOLD_PRELOAD = ((0x80, 0x250), (0x300, 0x370), (0x1E00, 0x1F00))
+
+class _FoldTable(dict):
+    """Bảng str.translate ký tự -> dạng bỏ dấu, tính bằng NFD lần đầu gặp rồi cache
+
+    Fold từng ký tự cho cùng kết quả với NFD cả chuỗi (dấu kết hợp đều bị
+    bỏ nên thứ tự sắp lại của NFD không ảnh hưởng), nhưng không phải tạo
+    chuỗi đã tách dấu rồi lọc từng ký tự trong Python.
+
+    Các dải Latin/tiếng Việt được tính sẵn lúc import; ký tự khác (emoji,
+    CJK...) chỉ được cache tới FOLD_TABLE_LIMIT mục để tin nhắn tuỳ ý
+    không làm bảng phình mãi.
+    """
+
+    def __init__(self):
+        super().__init__()
+        for start, end in _FOLD_PRELOAD:
+            for codepoint in range(start, end):
+                self[codepoint] = self._fold(codepoint)
+
+    @staticmethod
+    def _fold(codepoint: int):
+        char = chr(codepoint)
+        decomposed = unicodedata.normalize("NFD", char)
+        folded = "".join(c for c in decomposed if not unicodedata.combining(c))
+        folded = folded.replace("đ", "d").replace("Đ", "D")
+        return codepoint if folded == char else folded
+
+    def __missing__(self, codepoint: int):
+        value = self._fold(codepoint)
+        if len(self) < FOLD_TABLE_LIMIT:
+            self[codepoint] = value
+        return value
+
+_FOLD_TABLE = _FoldTable()
+
+def fold_text(text: str) -> str:
+    """Bỏ dấu tiếng Việt + lowercase: "Hoá đơn" -> "hoa don"
+
+    unicode61 remove_diacritics không gộp "đ" thành "d" nên fold trước khi index.
+    """
+    if not text:
+        return ""
+    if text.isascii():
+        return text.lower()
+    return text.translate(_FOLD_TABLE).lower()
+
+def to_epoch(value: datetime) -> int:
+    """Epoch giây; datetime không có timezone được hiểu là UTC (không phụ thuộc timezone của host)"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+def build_match(text: str) -> Optional[str]:
+    """Chuyển câu tìm kiếm thành biểu thức FTS5 an toàn (các từ AND, từ cuối dạng prefix)"""
+    words = _WORD_RE.findall(fold_text(text))
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words[:-1]] + [f'"{words[-1]}"*']
+    return " ".join(terms)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    sender_id INTEGER,
+    sender_name TEXT,
+    date INTEGER,
+    out INTEGER NOT NULL DEFAULT 0,
+    text TEXT NOT NULL,
+    UNIQUE (chat_id, message_id)
+);
+CREATE INDEX IF NOT EXISTS messages_date ON messages (date);
+CREATE INDEX IF NOT EXISTS messages_message_id ON messages (message_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+    body, sender, tokenize = "unicode61 remove_diacritics 2"
+);
+CREATE TABLE IF NOT EXISTS backfill (
+    chat_id INTEGER PRIMARY KEY,
+    completed_at INTEGER NOT NULL
+);
+"""
+
+class SearchIndex:
+    """Full-text index (SQLite FTS5) cho tin nhắn chat riêng và group/channel được theo dõi
+
+    Tin mới/sửa được gom vào buffer và ghi theo lô trên một thread riêng;
+    query cũng chạy trên thread đó nên không chặn event loop.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-index")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending: List[tuple] = []
+        self._deleted: List[tuple] = []
+        self._tasks: List[asyncio.Task] = []
+        self.ready = False
+        self.dropped = 0
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _open(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        self._conn = conn
+
+    async def start(self, client):
+        """Mở DB, chạy vòng flush và backfill ở background"""
+        await self._run(self._open)
+        self.ready = True
+        self._tasks = [
+            asyncio.create_task(self._flush_loop()),
+            asyncio.create_task(self._backfill(client))
+        ]
+        logger.info(f"🔎 Search index opened: {self.db_path}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self._conn is not None:
+            await self.flush()
+            await self._run(self._conn.close)
+            self._conn = None
+        self.ready = False
+
+    def add(self, chat_id: int, message, sender_name: str):
+        """Thêm/cập nhật một tin (ghi theo lô, không chặn)
+
+        Bỏ qua khi index chưa chạy (vd. mở DB thất bại) hoặc buffer đã đầy.
+        """
+        text = message.message or ""
+        if not text or not self.ready:
+            return
+        if len(self._pending) >= MAX_PENDING:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"⚠️ Search index buffer full, {self.dropped} messages dropped so far")
+            return
+        date = to_epoch(message.date) if message.date else None
+        self._pending.append((
+            chat_id, message.id, message.sender_id, sender_name, date, int(bool(message.out)), text
+        ))
+
+    def remove(self, chat_id: Optional[int], message_ids: List[int]):
+        """Xoá tin khỏi index
+        
+        chat_id None: update xoá không kèm chat (chat riêng/group thường) - ID
+        tin ở đó là duy nhất trong tài khoản nên xoá theo message_id, trừ channel.
+        """
+        if self.ready:
+            self._deleted.extend((chat_id, message_id) for message_id in message_ids)
+
+    async def flush(self):
+        if not (self._pending or self._deleted) or self._conn is None:
+            return
+        rows, self._pending = self._pending, []
+        deleted, self._deleted = self._deleted, []
+        await self._run(self._write, rows, deleted)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"❌ Search index flush failed: {e}")
+
+    def _write(self, rows: List[tuple], deleted: List[tuple]):
+        conn = self._conn
+        with conn:
+            for chat_id, message_id, sender_id, sender_name, date, out, text in rows:
+                row = conn.execute(
+                    "SELECT id FROM messages WHERE chat_id = ? AND message_id = ?",
+                    (chat_id, message_id)
+                ).fetchone()
+                if row is None:
+                    cursor = conn.execute(
+                        "INSERT INTO messages (chat_id, message_id, sender_id, sender_name, date, out, text) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (chat_id, message_id, sender_id, sender_name, date, out, text)
+                    )
+                    conn.execute(
+                        "INSERT INTO messages_fts (rowid, body, sender) VALUES (?, ?, ?)",
+                        (cursor.lastrowid, fold_text(text), fold_text(sender_name))
+                    )
+                else:
+                    conn.execute(
+                        "UPDATE messages SET text = ?, sender_name = ? WHERE id = ?",
+                        (text, sender_name, row[0])
+                    )
+                    conn.execute(
+                        "UPDATE messages_fts SET body = ?, sender = ? WHERE rowid = ?",
+                        (fold_text(text), fold_text(sender_name), row[0])
+                    )
+            for chat_id, message_id in deleted:
+                if chat_id is not None:
+                    where, params = "chat_id = ? AND message_id = ?", (chat_id, message_id)
+                else:
+                    where, params = "message_id = ? AND chat_id > ?", (message_id, CHANNEL_ID_BOUND)
+                conn.execute(
+                    f"DELETE FROM messages_fts WHERE rowid IN (SELECT id FROM messages WHERE {where})",
+                    params
+                )
+                conn.execute(f"DELETE FROM messages WHERE {where}", params)
+
+    async def search(
+        self,
+        query: str,
+        chat_id: Optional[int] = None,
+        sender: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        page: int = 1,
+        page_size: int = 20
+    ) -> dict:
+        """Tìm kiếm, xếp hạng bm25, phân trang"""
+        started = time.perf_counter()
+        match = build_match(query)
+        results, has_more = [], False
+        if match and self._conn is not None:
+            sender_match = build_match(sender) if sender else None
+            if sender_match:
+                match = f"body : ({match}) AND sender : ({sender_match})"
+            else:
+                match = f"body : ({match})"
+            rows = await self._run(
+                self._query, match, chat_id,
+                to_epoch(date_from) if date_from else None,
+                to_epoch(date_to) if date_to else None,
+                page_size + 1, (page - 1) * page_size
+            )
+            has_more = len(rows) > page_size
+            results = [
+                {
+                    "chat_id": row[0],
+                    "message_id": row[1],
+                    "sender_id": row[2],
+                    "sender": row[3],
+                    "date": datetime.fromtimestamp(row[4], timezone.utc).isoformat() if row[4] else None,
+                    "out": bool(row[5]),
+                    "text": row[6],
+                    "score": round(-row[7], 4)
+                }
+                for row in rows[:page_size]
+            ]
+        return {
+            "results": results,
+            "query": query,
+            "page": page,
+            "page_size": page_size,
+            "has_more": has_more,
+            "took_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    def _query(self, match: str, chat_id, date_from, date_to, limit: int, offset: int):
+        sql = [
+            "SELECT m.chat_id, m.message_id, m.sender_id, m.sender_name, m.date, m.out, m.text,",
+            "bm25(messages_fts) AS rank",
+            "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid",
+            "WHERE messages_fts MATCH ?"
+        ]
+        params: list = [match]
+        if chat_id is not None:
+            sql.append("AND m.chat_id = ?")
+            params.append(chat_id)
+        if date_from is not None:
+            sql.append("AND m.date >= ?")
+            params.append(date_from)
+        if date_to is not None:
+            sql.append("AND m.date <= ?")
+            params.append(date_to)
+        sql.append("ORDER BY rank LIMIT ? OFFSET ?")
+        params.extend([limit, offset])
+        return self._conn.execute(" ".join(sql), params).fetchall()
+
+    async def _backfill(self, client):
+        """Backfill lịch sử chat riêng từ iter_messages
+
+        Lần đầu lấy N tin mới nhất của mỗi chat. Các lần khởi động sau chỉ
+        lấy tin có ID lớn hơn high-water mark (tin lớn nhất đã index của
+        chat), cũ trước mới sau, nên tin đến lúc server tắt được bù lại.
+        """
+        try:
+            high_water = dict(await self._run(self._high_water_marks))
+            async for dialog in client.iter_dialogs(limit=settings.search_backfill_chats):
+                if not dialog.is_user:
+                    continue
+                last_id = high_water.get(dialog.id)
+                if last_id is not None and dialog.message is not None and dialog.message.id <= last_id:
+                    continue
+                me_name = "Me"
+                peer_name = " ".join(filter(None, [
+                    getattr(dialog.entity, 'first_name', None), getattr(dialog.entity, 'last_name', None)
+                ])) or dialog.name
+                if last_id is None:
+                    messages = client.iter_messages(dialog.id, limit=settings.search_backfill_messages)
+                else:
+                    messages = client.iter_messages(
+                        dialog.id, min_id=last_id, reverse=True, limit=settings.search_backfill_messages
+                    )
+                async for message in messages:
+                    self.add(dialog.id, message, me_name if message.out else peer_name)
+                    if len(self._pending) >= FLUSH_BATCH_SIZE:
+                        await self.flush()
+                await self.flush()
+                await self._run(
+                    self._mark_backfilled, dialog.id
+                )
+                await asyncio.sleep(1)  # nhẹ tay với flood limit
+            logger.info("🔎 Search index backfill completed")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Search index backfill failed: {e}")
+
+    def _high_water_marks(self) -> List[tuple]:
+        """(chat_id, ID tin lớn nhất đã index) của các chat đã backfill xong lần đầu"""
+        return self._conn.execute(
+            "SELECT b.chat_id, COALESCE(MAX(m.message_id), 0) FROM backfill b "
+            "LEFT JOIN messages m ON m.chat_id = b.chat_id GROUP BY b.chat_id"
+        ).fetchall()
+
+    def _mark_backfilled(self, chat_id: int):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO backfill (chat_id, completed_at) VALUES (?, ?)",
+                (chat_id, int(time.time()))
+            )
+
+# Singleton instance
+search_index = SearchIndex(settings.search_db_path)
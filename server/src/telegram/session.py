@@ -0,0 +1,270 @@
+# server/src/telegram/session.py
+import base64
+import datetime
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+from telethon import utils
+from telethon.crypto import AuthKey
+from telethon.sessions import MemorySession, SQLiteSession
+from telethon.sessions.memory import _SentFileType
+from telethon.tl import types
+from core.storage import write_atomic
+
+logger = logging.getLogger(__name__)
+
+SESSION_VERSION = 1
+# Số entity mỗi lần json.dumps: encoder C giữ GIL suốt một lần gọi,
+# chia nhỏ để thread ghi không chặn event loop quá vài trăm µs
+ENCODE_CHUNK = 1000
+
+class BufferedFileSession(MemorySession):
+    """Telethon session giữ trạng thái trong bộ nhớ, ghi xuống đĩa theo lô
+
+    SQLiteSession chạy INSERT/COMMIT ngay trên event loop (entity của mọi
+    update, update state mỗi phút). Ở đây mọi thay đổi chỉ cập nhật dict
+    trong bộ nhớ và tăng `_version`; một thread nền ghi JSON mỗi
+    `flush_interval` giây nếu có thay đổi, bằng file tạm + rename nên crash
+    giữa chừng không làm hỏng session. Auth key / DC mới được ghi ngay.
+
+    Lần đầu chạy sẽ nhập dữ liệu từ file `.session` (SQLite) cũ nếu có.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 5.0):
+        super().__init__()
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self._rows: Dict[int, tuple] = {}
+        self._usernames: Dict[str, int] = {}
+        self._phones: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._version = 0
+        self._saved_version = 0
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.flushes = 0
+
+        if self.path.exists():
+            self._load()
+        else:
+            self._import_sqlite(self.path.with_suffix(".session"))
+
+    # Lưu trữ
+
+    def _load(self):
+        data = json.loads(self.path.read_bytes())
+        self._dc_id = data.get("dc_id") or 0
+        self._server_address = data.get("server_address")
+        self._port = data.get("port")
+        self._takeout_id = data.get("takeout_id")
+        if data.get("auth_key"):
+            self._auth_key = AuthKey(data=base64.b64decode(data["auth_key"]))
+        for row in data.get("entities", []):
+            self._put_row(tuple(row))
+        for entity_id, (pts, qts, date, seq) in data.get("update_states", {}).items():
+            self._update_states[int(entity_id)] = types.updates.State(
+                pts, qts, datetime.datetime.fromtimestamp(date, tz=datetime.timezone.utc), seq, unread_count=0
+            )
+        for md5_digest, file_size, file_type, file_id, file_hash in data.get("files", []):
+            self._files[(base64.b64decode(md5_digest), file_size, _SentFileType(file_type))] = (file_id, file_hash)
+        logger.info(f"🔑 Session loaded: {len(self._rows)} entities, {len(self._update_states)} update states")
+
+    def _import_sqlite(self, legacy_path: Path):
+        """Chuyển session SQLite cũ sang định dạng mới (chạy một lần)"""
+        if not legacy_path.exists():
+            return
+        legacy = SQLiteSession(str(legacy_path))
+        try:
+            self._dc_id = legacy.dc_id
+            self._server_address = legacy.server_address
+            self._port = legacy.port
+            self._auth_key = legacy.auth_key
+            self._takeout_id = legacy.takeout_id
+            cursor = legacy._cursor()
+            for row in cursor.execute("select id, hash, username, phone, name from entities"):
+                self._put_row(tuple(row))
+            for md5_digest, file_size, file_type, file_id, file_hash in cursor.execute("select * from sent_files"):
+                self._files[(md5_digest, file_size, _SentFileType(file_type))] = (file_id, file_hash)
+            cursor.close()
+            self._update_states.update(legacy.get_update_states())
+        finally:
+            legacy.close()
+        self._version += 1
+        self.flush()
+        logger.info(f"🔑 Imported legacy session {legacy_path} ({len(self._rows)} entities)")
+
+    def _export(self) -> dict:
+        return {
+            "version": SESSION_VERSION,
+            "dc_id": self._dc_id,
+            "server_address": self._server_address,
+            "port": self._port,
+            "takeout_id": self._takeout_id,
+            "auth_key": base64.b64encode(self._auth_key.key).decode() if self._auth_key else None,
+            "entities": list(self._rows.values()),
+            "update_states": {
+                str(entity_id): [state.pts, state.qts, state.date.timestamp(), state.seq]
+                for entity_id, state in self._update_states.items()
+            },
+            "files": [
+                [base64.b64encode(md5_digest).decode(), file_size, file_type.value, file_id, file_hash]
+                for (md5_digest, file_size, file_type), (file_id, file_hash) in self._files.items()
+            ]
+        }
+
+    def flush(self):
+        """Ghi xuống đĩa nếu có thay đổi (gọi từ thread nền hoặc khi đóng)"""
+        with self._lock:
+            if self._version == self._saved_version:
+                return
+            version = self._version
+            state = self._export()
+        write_atomic(self.path, self._encode(state))
+        self._saved_version = version
+        self.flushes += 1
+
+    @staticmethod
+    def _encode(state: dict) -> bytes:
+        entities = state.pop("entities")
+        chunks = [
+            json.dumps(entities[i:i + ENCODE_CHUNK], separators=(",", ":"))[1:-1]
+            for i in range(0, len(entities), ENCODE_CHUNK)
+        ]
+        head = json.dumps(state, separators=(",", ":"))
+        return f'{head[:-1]},"entities":[{",".join(chunks)}]}}'.encode()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"❌ Failed to write session {self.path}: {e}")
+
+    def _touch(self, urgent: bool = False):
+        """Đánh dấu có thay đổi (gọi khi đang giữ `_lock`), khởi động thread ghi nếu cần"""
+        self._version += 1
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="session-flush", daemon=True)
+            self._thread.start()
+        if urgent:
+            self._wake.set()
+
+    # Session API của Telethon
+
+    def set_dc(self, dc_id, server_address, port):
+        with self._lock:
+            super().set_dc(dc_id, server_address, port)
+            self._touch(urgent=True)
+
+    @MemorySession.auth_key.setter
+    def auth_key(self, value):
+        with self._lock:
+            self._auth_key = value
+            self._touch(urgent=True)
+
+    @MemorySession.takeout_id.setter
+    def takeout_id(self, value):
+        with self._lock:
+            self._takeout_id = value
+            self._touch(urgent=True)
+
+    def set_update_state(self, entity_id, state):
+        with self._lock:
+            self._update_states[entity_id] = state
+            self._touch()
+
+    def save(self):
+        """Telethon gọi save() trên event loop: chỉ đánh thức thread ghi"""
+        self._wake.set()
+
+    def close(self):
+        """Dừng thread nền và ghi lần cuối (khi disconnect)"""
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def delete(self):
+        self._stopping = True
+        self._wake.set()
+        with self._lock:
+            self._saved_version = self._version
+        try:
+            self.path.unlink()
+            return True
+        except OSError:
+            return False
+
+    def process_entities(self, tlo):
+        rows = self._entities_to_rows(tlo)
+        if not rows:
+            return
+        with self._lock:
+            changed = False
+            for row in rows:
+                changed = self._put_row(row) or changed
+            if changed:
+                self._touch()
+
+    def _entity_to_row(self, e):
+        # Keepalive của Telethon gửi lại toàn bộ entity cache dưới dạng InputPeer
+        # mỗi phút: tạo row trực tiếp, bỏ qua get_input_peer/get_display_name
+        if isinstance(e, types.InputPeerUser):
+            return e.user_id, e.access_hash, None, None, None
+        if isinstance(e, types.InputPeerChannel):
+            return utils.get_peer_id(types.PeerChannel(e.channel_id)), e.access_hash, None, None, None
+        return super()._entity_to_row(e)
+
+    def _put_row(self, row: tuple) -> bool:
+        """Thêm/cập nhật entity; giữ username/phone/tên cũ nếu row mới thiếu"""
+        entity_id, entity_hash, username, phone, name = row
+        old = self._rows.get(entity_id)
+        if old is not None:
+            username = username or old[2]
+            phone = phone or old[3]
+            name = name or old[4]
+            if old[2] and old[2] != username and self._usernames.get(old[2]) == entity_id:
+                del self._usernames[old[2]]
+        new = (entity_id, entity_hash, username, phone, name)
+        if new == old:
+            return False
+        self._rows[entity_id] = new
+        if username:
+            self._usernames[username] = entity_id
+        if phone:
+            self._phones[str(phone)] = entity_id
+        return True
+
+    def get_entity_rows_by_phone(self, phone):
+        entity_id = self._phones.get(str(phone))
+        return self._rows[entity_id][:2] if entity_id is not None else None
+
+    def get_entity_rows_by_username(self, username):
+        entity_id = self._usernames.get(username)
+        return self._rows[entity_id][:2] if entity_id is not None else None
+
+    def get_entity_rows_by_name(self, name):
+        return next((row[:2] for row in self._rows.values() if row[4] == name), None)
+
+    def get_entity_rows_by_id(self, id, exact=True):
+        if exact:
+            row = self._rows.get(id)
+            return row[:2] if row else None
+        for peer in (types.PeerUser(id), types.PeerChat(id), types.PeerChannel(id)):
+            row = self._rows.get(utils.get_peer_id(peer))
+            if row:
+                return row[:2]
+        return None
+
+    def cache_file(self, md5_digest, file_size, instance):
+        with self._lock:
+            super().cache_file(md5_digest, file_size, instance)
+            self._touch()
@@ -0,0 +1,240 @@
+# server/src/telegram/snapshot.py
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional
+from core.config import settings
+from core.invalidation import invalidation, TAG_ME
+from core.storage import write_atomic
+from .dialogs import dialog_index
+from .schemas import TelegramUser
+from .routing import message_router
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+def _memory_entities(session) -> Optional[set]:
+    """Entity cache của StringSession (session file đã tự lưu entity xuống đĩa)"""
+    from telethon.sessions import StringSession
+    return session._entities if isinstance(session, StringSession) else None
+
+class WarmSnapshot:
+    """Snapshot trạng thái nóng để khởi động lại không phải bắt đầu từ lạnh
+
+    Giữ kết quả get_me, entity đã resolve (id, access_hash, tên), dialog
+    index và tin nhắn gần đây của các chat vừa xem. Ghi ra JSON định kỳ và
+    khi shutdown; lúc khởi động nạp lại trước khi kết nối Telegram để các
+    request đầu tiên trả lời ngay từ bộ nhớ, không gọi lại Telegram.
+
+    Tin nhắn nạp từ snapshot ("warm") chỉ được phục vụ trong `warm_ttl`
+    giây sau khởi động, và bị bỏ khi có sự kiện mới trong chat hoặc khi
+    dialog index (sau đối chiếu) cho thấy chat đã có tin mới hơn.
+    """
+
+    def __init__(self, path: str, interval: float, max_chats: int, messages_per_chat: int, warm_ttl: float):
+        self.path = Path(path)
+        self.interval = interval
+        self.max_chats = max_chats
+        self.messages_per_chat = messages_per_chat
+        self.warm_ttl = warm_ttl
+        self.me: Optional[dict] = None
+        self._messages: "OrderedDict[int, dict]" = OrderedDict()
+        self._entities: List[tuple] = []
+        self._loaded_at = 0.0
+        self._client = None
+        self._task: Optional[asyncio.Task] = None
+        self.warm_hits = 0
+
+    async def load(self):
+        """Đọc snapshot từ đĩa (nếu có) và khôi phục dialog index / tin nhắn
+
+        Không bao giờ raise: snapshot hỏng (cắt cụt, sửa tay, sai cấu trúc)
+        bị xoá và server khởi động lạnh như khi không có snapshot.
+        """
+        if not self.path.exists():
+            return
+        started = time.perf_counter()
+        try:
+            data = await asyncio.to_thread(lambda: json.loads(self.path.read_bytes()))
+            if data.get("version") != SNAPSHOT_VERSION:
+                logger.info(f"📸 Snapshot version {data.get('version')} not supported, starting cold")
+                return
+            self._restore(data)
+        except Exception as e:
+            logger.error(f"❌ Discarding corrupt snapshot {self.path}: {e}")
+            self.me = None
+            self._entities = []
+            self._messages.clear()
+            self.path.unlink(missing_ok=True)
+            return
+        self._loaded_at = time.monotonic()
+        saved_at = data.get("saved_at", 0)
+        logger.info(
+            f"📸 Snapshot loaded in {(time.perf_counter() - started) * 1000:.0f}ms "
+            f"({len(dialog_index)} dialogs, {len(self._messages)} chats, "
+            f"{len(self._entities)} entities, {time.time() - saved_at:.0f}s old)"
+        )
+
+    def _restore(self, data: dict):
+        # Dựng toàn bộ trạng thái trước, chỉ gán khi mọi thứ hợp lệ
+        me = data.get("me")
+        if me is not None:
+            me = TelegramUser(**me).dict()
+        entities = [tuple(row) for row in data.get("entities", [])]
+        messages: "OrderedDict[int, dict]" = OrderedDict()
+        for chat_id, cached in data.get("messages", {}).items():
+            messages[int(chat_id)] = {
+                "messages": list(cached["messages"]),
+                "limit": int(cached["limit"]),
+                "warm": True
+            }
+        message_ids = {chat_id: [int(m["id"]) for m in cached["messages"]] for chat_id, cached in messages.items()}
+
+        dialog_index.restore(data.get("dialogs") or {})
+        self.me = me
+        self._entities = entities
+        self._messages = messages
+        for chat_id, ids in message_ids.items():
+            # Để sự kiện xoá tin trong snapshot vẫn định tuyến được theo chat
+            if dialog_index.chat_type(chat_id) != "channel":
+                for message_id in ids:
+                    message_router.record(chat_id, message_id)
+
+    async def start(self, client):
+        """Gắn entity vào session của client, làm mới get_me và bắt đầu ghi định kỳ"""
+        self._client = client
+        entities = _memory_entities(client.session)
+        if entities is not None and self._entities:
+            known = {row[0] for row in entities}
+            entities.update(row for row in self._entities if row[0] not in known)
+        self._entities = []
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(client))
+
+    async def stop(self):
+        """Dừng ghi định kỳ và ghi snapshot cuối cùng"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Chỉ ghi khi đã chạy thật, không ghi đè snapshot tốt bằng trạng thái rỗng
+        if self._client is not None:
+            await self.save()
+
+    async def _run(self, client):
+        await self.refresh_me(client)
+        while True:
+            await asyncio.sleep(self.interval)
+            # /api/me phục vụ từ self.me: làm mới định kỳ để đổi tên/username được cập nhật
+            await self.refresh_me(client)
+            await self.save()
+
+    async def refresh_me(self, client):
+        """Gọi lại get_me; đổi thì invalidate /api/me"""
+        try:
+            previous = self.me
+            self.record_me(await client.get_me())
+            if self.me != previous:
+                invalidation.invalidate(TAG_ME)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Failed to refresh user info: {e}")
+
+    async def save(self):
+        """Chụp trạng thái trên event loop, serialize + ghi file ở thread riêng"""
+        entities = _memory_entities(self._client.session) if self._client else None
+        rows = list(entities) if entities is not None else self._entities
+        state = {
+            "version": SNAPSHOT_VERSION,
+            "saved_at": time.time(),
+            # Không lưu số điện thoại (của mình và của entity) ra đĩa
+            "me": {**self.me, "phone": None} if self.me else None,
+            "entities": [(row[0], row[1], row[2], None, *row[4:]) for row in rows],
+            "dialogs": dialog_index.export(),
+            "messages": {
+                str(chat_id): {"messages": cached["messages"], "limit": cached["limit"]}
+                for chat_id, cached in self._messages.items()
+            }
+        }
+        try:
+            await asyncio.to_thread(self._write, state)
+        except Exception as e:
+            logger.error(f"❌ Failed to write snapshot: {e}")
+
+    def _write(self, state: dict):
+        data = json.dumps(state, separators=(",", ":"), ensure_ascii=False).encode()
+        write_atomic(self.path, data)
+        logger.info(f"📸 Snapshot written: {len(data) / 1024:.1f} KiB")
+
+    def record_me(self, me):
+        if me is None:
+            return
+        self.me = {
+            "id": me.id,
+            "username": me.username,
+            "first_name": me.first_name,
+            "last_name": me.last_name,
+            "phone": me.phone
+        }
+
+    def record_messages(self, chat_id: int, messages: List[dict], limit: int):
+        """Lưu kết quả /api/chat/{id}/messages mới nhất của chat để đưa vào snapshot"""
+        self._messages.pop(chat_id, None)
+        self._messages[chat_id] = {
+            "messages": messages[:self.messages_per_chat],
+            "limit": min(limit, self.messages_per_chat),
+            "warm": False
+        }
+        while len(self._messages) > self.max_chats:
+            self._messages.popitem(last=False)
+
+    def warm_messages(self, chat_id: int, limit: int) -> Optional[List[dict]]:
+        """Tin nhắn từ snapshot nếu còn dùng được cho request này, ngược lại None"""
+        cached = self._messages.get(chat_id)
+        if cached is None or not cached["warm"]:
+            return None
+        if time.monotonic() - self._loaded_at > self.warm_ttl:
+            cached["warm"] = False
+            return None
+        messages = cached["messages"]
+        # Đủ tin cho limit, hoặc lần lấy trước đã hết lịch sử chat
+        if limit > len(messages) and len(messages) >= cached["limit"]:
+            return None
+        newest = dialog_index.last_message_id(chat_id)
+        if messages and newest is not None and newest > messages[0]["id"]:
+            cached["warm"] = False
+            return None
+        self.warm_hits += 1
+        return messages[:limit]
+
+    def invalidate(self, chat_id: Optional[int]):
+        """Có sự kiện trong chat: tin nhắn warm của chat không còn đúng"""
+        cached = self._messages.get(chat_id)
+        if cached is not None:
+            cached["warm"] = False
+
+    def stats(self) -> dict:
+        return {
+            "path": str(self.path),
+            "loaded": self._loaded_at > 0,
+            "chats": len(self._messages),
+            "warm_chats": sum(1 for cached in self._messages.values() if cached["warm"]),
+            "warm_hits": self.warm_hits
+        }
+
+# Singleton instance
+warm_snapshot = WarmSnapshot(
+    path=settings.snapshot_path,
+    interval=settings.snapshot_interval,
+    max_chats=settings.snapshot_chats,
+    messages_per_chat=settings.snapshot_messages_per_chat,
+    warm_ttl=settings.snapshot_warm_ttl
+)
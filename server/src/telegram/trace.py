@@ -0,0 +1,289 @@
+# server/src/telegram/trace.py
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 1.0
+CHANNEL_ID_BASE = -1000000000000
+# Lỗi khi đọc trace bị cắt ngang (member gzip dở, dòng JSON dở)
+_TRUNCATED_ERRORS = (EOFError, OSError, ValueError, zlib.error)
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+# Ký tự thay thế theo số byte UTF-8 của ký tự gốc (1-4 byte)
+_MASK_BY_WIDTH = {1: "x", 2: "ă", 3: "ạ", 4: "😀"}
+
+def mask_text(text: str) -> str:
+    """Ẩn nội dung nhưng giữ hình dạng: số ký tự, khoảng trắng, số byte UTF-8
+
+    Mọi ký tự không phải khoảng trắng (cả emoji, dấu câu) đều bị thay bằng
+    ký tự có cùng độ dài UTF-8; chữ số ASCII thành "0".
+    """
+    out = []
+    for char in text:
+        if char.isspace():
+            out.append(char)
+        elif "0" <= char <= "9":
+            out.append("0")
+        else:
+            out.append(_MASK_BY_WIDTH[len(char.encode("utf-8", "surrogatepass"))])
+    return "".join(out)
+
+def media_kind(message) -> Optional[str]:
+    if message.media is None:
+        return None
+    if message.voice or message.audio:
+        return "voice"
+    if message.photo:
+        return "photo"
+    if message.document:
+        return "doc"
+    return "other"
+
+class TraceRecorder:
+    """Ghi trace ẩn danh của các update đến (JSON lines, `.gz` thì nén)
+
+    Mỗi dòng: `t` giây kể từ lúc bắt đầu trace, `k` loại (n=new, e=edit, d=delete),
+    `c`/`s`/`m` là ID chat/người gửi/tin đã thay bằng số thứ tự, `ct` loại
+    chat (u=riêng, g=group, s=supergroup, c=channel), nội dung chữ được che bởi mask_text. Trace giữ nguyên
+    nhịp burst, edit storm, độ dài và loại media để replay như production.
+
+    Ghi tiếp vào trace có sẵn: `t` nối tiếp từ dòng cuối (bỏ khoảng thời
+    gian server tắt), ID ẩn danh đánh tiếp từ giá trị lớn nhất nên không
+    trùng với lần chạy trước, và max_events tính cả các dòng đã có.
+    """
+
+    def __init__(self, path: str, max_events: int):
+        self.path = path
+        self.max_events = max_events
+        self.recorded = 0
+        self._started = time.monotonic()
+        self._buffer: List[str] = []
+        self._ids: Dict[tuple, int] = {}
+        self._id_base = 0
+        self._file = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            recorded, last_t, max_id = await asyncio.to_thread(self._resume_state)
+            self.recorded = recorded
+            self._id_base = max_id
+            self._file = _open(self.path, "a")
+            self._started = time.monotonic() - last_t
+            self._task = asyncio.create_task(self._flush_loop())
+            logger.info(f"🎙️ Recording update trace to {self.path}"
+                        f"{f' (resuming after {recorded} events)' if recorded else ''}")
+
+    def _resume_state(self) -> tuple:
+        """(số event, `t` cuối, ID ẩn danh lớn nhất) của trace có sẵn
+
+        Server tắt giữa lúc ghi có thể để lại dòng JSON dở hoặc member gzip
+        bị cắt: chỉ tính tới bản ghi đầy đủ cuối cùng và ghi lại file chỉ
+        gồm các bản ghi đó, để dòng ghi tiếp không dính vào phần hỏng.
+        """
+        recorded, last_t, max_id = 0, 0.0, 0
+        if not os.path.exists(self.path):
+            return recorded, last_t, max_id
+        truncated = False
+        try:
+            with _open(self.path, "r") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        truncated = True
+                        break
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    recorded += 1
+                    last_t = max(last_t, entry.get("t", 0.0))
+                    max_id = max(max_id, entry.get("c", 0), entry.get("s", 0), entry.get("m", 0), *entry.get("ids", ()))
+        except _TRUNCATED_ERRORS:
+            truncated = True
+        if truncated:
+            logger.warning(f"⚠️ Trace {self.path} ends with a partial record, keeping {recorded} events")
+            self._rewrite(recorded)
+        return recorded, last_t, max_id
+
+    def _rewrite(self, keep: int):
+        """Ghi lại trace chỉ với `keep` bản ghi đầu (bỏ phần đuôi hỏng)"""
+        root, ext = os.path.splitext(self.path)
+        tmp = f"{root}.tmp{ext}"  # giữ đuôi `.gz` để _open nén giống file gốc
+        kept = 0
+        with _open(self.path, "r") as src, _open(tmp, "w") as dst:
+            try:
+                for line in src:
+                    if kept >= keep:
+                        break
+                    dst.write(line)
+                    if line.strip():
+                        kept += 1
+            except _TRUNCATED_ERRORS:
+                pass
+        os.replace(tmp, self.path)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await asyncio.to_thread(self._write, self._drain())
+            self._file.close()
+            logger.info(f"🎙️ Trace closed: {self.recorded} events")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            lines = self._drain()
+            if lines:
+                await asyncio.to_thread(self._write, lines)
+
+    def _drain(self) -> List[str]:
+        lines, self._buffer = self._buffer, []
+        return lines
+
+    def _write(self, lines: List[str]):
+        if lines:
+            self._file.write("".join(lines))
+            self._file.flush()
+
+    def _anon(self, kind: str, value) -> int:
+        key = (kind, value)
+        anon = self._ids.get(key)
+        if anon is None:
+            anon = self._ids[key] = self._id_base + len(self._ids) + 1
+        return anon
+
+    def _message(self, channel_id: Optional[int], message_id: int) -> int:
+        # ID tin ngoài channel là duy nhất trong tài khoản (MessageDeleted không có chat_id)
+        return self._anon("msg", (channel_id, message_id))
+
+    def _chat(self, event) -> dict:
+        if event.is_private:
+            chat_type = "u"
+        elif event.is_channel:
+            chat_type = "s" if event.is_group else "c"
+        else:
+            chat_type = "g"
+        return {"ct": chat_type, "c": self._anon("peer", event.chat_id)}
+
+    def _append(self, entry: dict):
+        if self.recorded >= self.max_events:
+            return
+        self.recorded += 1
+        entry["t"] = round(time.monotonic() - self._started, 4)
+        self._buffer.append(json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n")
+
+    def record_message(self, event, edited: bool = False):
+        message = event.message
+        entry = {
+            "k": "e" if edited else "n",
+            **self._chat(event),
+            "s": self._anon("peer", message.sender_id),
+            "m": self._message(event.chat_id if event.is_channel else None, message.id),
+            "o": int(bool(message.out)),
+            "x": mask_text(message.message or "")
+        }
+        kind = media_kind(message)
+        if kind:
+            entry["md"] = kind
+        if message.reply_to is not None:
+            entry["r"] = 1
+        self._append(entry)
+
+    def record_deleted(self, event):
+        entry = {"k": "d", "ids": [self._message(event.chat_id, i) for i in event.deleted_ids]}
+        # MessageDeleted chỉ có chat_id ở channel/supergroup
+        if event.chat_id is not None:
+            entry["c"] = self._anon("peer", event.chat_id)
+        self._append(entry)
+
+def read_trace(path: str) -> Iterator[dict]:
+    with _open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+# Đối tượng giả lập event Telethon dựng từ trace (cho replay)
+
+class _Namespace:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+class ReplayMessage(_Namespace):
+    voice = audio = photo = document = entities = None
+    mentioned = False
+
+class ReplayEvent(_Namespace):
+    """Event tối thiểu mà handlers/dialog index dùng tới"""
+
+    async def get_sender(self):
+        return self.sender
+
+    async def get_chat(self):
+        return self.chat
+
+def _chat_id(entry: dict) -> int:
+    chat_type = entry.get("ct", "c")
+    if chat_type == "u":
+        return entry["c"]
+    if chat_type == "g":
+        return -entry["c"]
+    return CHANNEL_ID_BASE - entry["c"]
+
+def build_event(entry: dict) -> ReplayEvent:
+    """Dựng event từ một dòng trace"""
+    kind = entry["k"]
+    if kind == "d":
+        chat_id = _chat_id(entry) if "c" in entry else None
+        return ReplayEvent(kind=kind, chat_id=chat_id, deleted_ids=entry["ids"], deleted_id=entry["ids"][0])
+
+    chat_id = _chat_id(entry)
+    sender_id = entry.get("s", 0)
+    sender = _Namespace(id=sender_id, first_name=f"User{sender_id}", last_name=None, username=None)
+    if entry["ct"] == "u":
+        chat = sender
+    else:
+        chat = _Namespace(id=chat_id, title=f"Chat{entry['c']}", broadcast=entry["ct"] == "c")
+    message = ReplayMessage(
+        id=entry["m"],
+        message=entry.get("x", ""),
+        date=datetime.now(timezone.utc),
+        out=bool(entry.get("o")),
+        media=entry.get("md"),
+        reply_to=True if entry.get("r") else None,
+        sender_id=sender_id
+    )
+    if message.media == "voice":
+        message.voice = True
+    return ReplayEvent(
+        kind=kind,
+        chat_id=chat_id,
+        is_private=entry["ct"] == "u",
+        is_group=entry["ct"] in ("g", "s"),
+        is_channel=entry["ct"] in ("s", "c"),
+        peer_id=_Namespace(user_id=chat_id),
+        message=message,
+        sender=sender,
+        chat=chat
+    )
+
+# Singleton instance (chỉ khi bật TRACE_PATH)
+trace_recorder: Optional[TraceRecorder] = (
+    TraceRecorder(settings.trace_path, settings.trace_max_events) if settings.trace_path else None
+)
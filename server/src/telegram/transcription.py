@@ -0,0 +1,170 @@
+# server/src/telegram/transcription.py
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Set
+import aiofiles
+import httpx
+from api.websocket import websocket_manager
+from core.config import settings
+from .media import MediaRef, media_cache
+
+logger = logging.getLogger(__name__)
+
+class BaseRecognizer(ABC):
+    """Interface cho recognizer: nhận file audio, trả về văn bản"""
+
+    name = "base"
+
+    @abstractmethod
+    async def transcribe(self, path: Path, mime_type: str) -> str:
+        ...
+
+    async def aclose(self):
+        """Giải phóng tài nguyên (HTTP client...) khi tắt server"""
+
+class StubRecognizer(BaseRecognizer):
+    """Recognizer giả lập cho test/local, không gọi dịch vụ ngoài"""
+
+    name = "stub"
+
+    async def transcribe(self, path: Path, mime_type: str) -> str:
+        return f"[voice message, {path.stat().st_size} bytes]"
+
+class HuggingFaceRecognizer(BaseRecognizer):
+    """Whisper qua Hugging Face Inference API (cùng model client đang dùng)"""
+
+    name = "huggingface"
+    API_URL = "https://api-inference.huggingface.co/models/{model}"
+
+    def __init__(self, model: str, token: Optional[str], timeout: float = 60.0):
+        self.url = self.API_URL.format(model=model)
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self._http = httpx.AsyncClient(timeout=timeout)
+
+    async def transcribe(self, path: Path, mime_type: str) -> str:
+        async with aiofiles.open(path, "rb") as f:
+            audio = await f.read()
+        response = await self._http.post(
+            self.url,
+            content=audio,
+            headers={**self.headers, "Content-Type": mime_type}
+        )
+        response.raise_for_status()
+        return (response.json().get("text") or "").strip()
+
+    async def aclose(self):
+        await self._http.aclose()
+
+RECOGNIZERS = {
+    StubRecognizer.name: lambda: StubRecognizer(),
+    HuggingFaceRecognizer.name: lambda: HuggingFaceRecognizer(settings.transcription_model, settings.hf_token),
+}
+
+def create_recognizer(name: str) -> BaseRecognizer:
+    if name not in RECOGNIZERS:
+        raise ValueError(f"Unknown transcription backend: {name}")
+    return RECOGNIZERS[name]()
+
+def is_voice_message(message) -> bool:
+    """Voice note hoặc file audio"""
+    return message.media is not None and bool(message.voice or message.audio)
+
+class TranscriptionService:
+    """Transcribe voice/audio đến ở background và broadcast `message_transcribed`
+
+    Kết quả cache theo Telegram document ID nên forward/gửi lại cùng file
+    không bao giờ bị transcribe lần hai. Semaphore giới hạn số job đồng thời
+    và hàng đợi có giới hạn để một loạt voice note không lấn át tin text.
+    """
+
+    def __init__(self, recognizer: BaseRecognizer, concurrency: int, max_pending: int, cache_size: int):
+        self.recognizer = recognizer
+        self.max_pending = max_pending
+        self.cache_size = cache_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    def submit(self, client, chat_id: int, sender: str, message) -> bool:
+        """Lên lịch transcribe một tin voice, trả về False nếu bị bỏ qua do quá tải"""
+        ref = MediaRef.from_message(message)
+        if ref is None:
+            return False
+        if ref.key not in self._cache and len(self._tasks) >= self.max_pending:
+            logger.warning(f"⚠️ Transcription queue full ({self.pending}), skipping message {message.id}")
+            return False
+        task = asyncio.create_task(self._process(client, chat_id, sender, message.id, ref))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def transcribe(self, client, ref: MediaRef) -> str:
+        """Văn bản của file audio, dùng cache / job đang chạy nếu có"""
+        cached = self._cache.get(ref.key)
+        if cached is not None:
+            self._cache.move_to_end(ref.key)
+            return cached
+
+        inflight = self._inflight.get(ref.key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[ref.key] = future
+        try:
+            async with self._semaphore:
+                path = await media_cache.fetch(client, ref)
+                text = await self.recognizer.transcribe(path, ref.mime_type)
+            self._cache[ref.key] = text
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            future.set_result(text)
+            return text
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # đã xử lý, tránh warning "never retrieved"
+            raise
+        finally:
+            # Bị cancel giữa chừng: huỷ future để các request đang chờ không treo
+            if not future.done():
+                future.cancel()
+            self._inflight.pop(ref.key, None)
+
+    async def stop(self):
+        """Huỷ các job đang chờ và đóng recognizer"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.recognizer.aclose()
+
+    async def _process(self, client, chat_id: int, sender: str, message_id: int, ref: MediaRef):
+        try:
+            text = await self.transcribe(client, ref)
+            logger.info(f"🗣️ Transcribed message {message_id} from {sender}: {text[:50]}...")
+            await websocket_manager.broadcast_message({
+                "type": "message_transcribed",
+                "chat_id": chat_id,
+                "message_id": message_id,
+                "sender": sender,
+                "text": text
+            })
+        except Exception as e:
+            logger.error(f"❌ Transcription failed for message {message_id}: {e}")
+
+# Singleton instance (None khi tắt)
+transcription_service: Optional[TranscriptionService] = None
+if settings.transcription_enabled:
+    transcription_service = TranscriptionService(
+        create_recognizer(settings.transcription_backend),
+        concurrency=settings.transcription_concurrency,
+        max_pending=settings.transcription_max_pending,
+        cache_size=settings.transcription_cache_size
+    )
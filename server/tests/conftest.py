@@ -0,0 +1,12 @@
+# server/tests/conftest.py
+"""Cấu hình chung cho test: import từ src/ và biến môi trường giả cho Settings"""
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+for key, value in {
+    "TELEGRAM_API_ID": "1", "TELEGRAM_API_HASH": "test", "TELEGRAM_PHONE": "+10000000000",
+    "TELEGRAM_SESSION_STRING": "", "SECRET_KEY": "test", "DATABASE_URL": "",
+}.items():
+    os.environ.setdefault(key, value)
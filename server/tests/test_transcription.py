@@ -0,0 +1,85 @@
+# server/tests/test_transcription.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from telegram import transcription
+from telegram.media import MediaRef
+from telegram.transcription import StubRecognizer, TranscriptionService
+
+class CountingRecognizer(StubRecognizer):
+    """StubRecognizer đếm số lần gọi, có thể giữ job lại cho tới khi `release`"""
+
+    def __init__(self, gated: bool = False):
+        self.calls = 0
+        self.release = asyncio.Event()
+        if not gated:
+            self.release.set()
+
+    async def transcribe(self, path, mime_type):
+        self.calls += 1
+        await self.release.wait()
+        return await super().transcribe(path, mime_type)
+
+def voice_message(message_id: int, document_id: int):
+    document = SimpleNamespace(id=document_id, size=4, mime_type="audio/ogg")
+    return SimpleNamespace(id=message_id, media=object(), document=document, photo=None, voice=True, audio=None)
+
+def make_service(recognizer, max_pending: int = 10) -> TranscriptionService:
+    return TranscriptionService(recognizer, concurrency=2, max_pending=max_pending, cache_size=16)
+
+@pytest.fixture(autouse=True)
+def fake_media(tmp_path, monkeypatch):
+    """media_cache.fetch trả về file audio cục bộ thay vì tải từ Telegram"""
+    audio = tmp_path / "voice.ogg"
+    audio.write_bytes(b"OggS")
+
+    async def fetch(client, ref):
+        return audio
+
+    monkeypatch.setattr(transcription.media_cache, "fetch", fetch)
+
+def ref_for(document_id: int) -> MediaRef:
+    return MediaRef.from_message(voice_message(1, document_id))
+
+@pytest.mark.asyncio
+async def test_result_cached_by_document_key():
+    recognizer = CountingRecognizer()
+    service = make_service(recognizer)
+
+    first = await service.transcribe(None, ref_for(7))
+    # Cùng document (vd. tin forward) thì dùng lại kết quả
+    second = await service.transcribe(None, ref_for(7))
+    await service.transcribe(None, ref_for(8))
+
+    assert first == second == "[voice message, 4 bytes]"
+    assert recognizer.calls == 2
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_inflight_job():
+    recognizer = CountingRecognizer(gated=True)
+    service = make_service(recognizer)
+
+    jobs = [asyncio.create_task(service.transcribe(None, ref_for(7))) for _ in range(3)]
+    await asyncio.sleep(0)
+    recognizer.release.set()
+    results = await asyncio.gather(*jobs)
+
+    assert len(set(results)) == 1
+    assert recognizer.calls == 1
+
+@pytest.mark.asyncio
+async def test_submit_rejected_when_queue_full():
+    recognizer = CountingRecognizer(gated=True)
+    service = make_service(recognizer, max_pending=1)
+
+    assert service.submit(None, 1, "alice", voice_message(1, 7))
+    assert not service.submit(None, 1, "alice", voice_message(2, 8))
+    assert service.pending == 1
+
+    recognizer.release.set()
+    await asyncio.gather(*service._tasks)
+    # Đã có trong cache thì không tính vào giới hạn
+    assert service.submit(None, 1, "alice", voice_message(3, 7))
+    await service.stop()